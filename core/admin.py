@@ -31,6 +31,9 @@ class TagInline(GenericTabularInline):
     extra = 0
     min_num = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tag')
+
 
 class CustomPlaceAdmin(PlaceAdmin):
     inlines = [TagInline]
@@ -0,0 +1,23 @@
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication for async views, which DRF does not authenticate.
+    Only the user lookup touches the database.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        # Same checks as the sync lookup (active user, revoked tokens)
+        user = await sync_to_async(self.get_user)(validated_token)
+        return user, validated_token
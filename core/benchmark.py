@@ -0,0 +1,454 @@
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from countries import geo, search, trending
+from countries.cache import response_cache
+from countries.models import Address, Country, Member, Place, PlaceSearchTerm, State, Trip, TripPlace, Visitor
+from countries.ratings import rebuild_rating_aggregates
+from countries.updates import fast_bulk_update
+from likes.counters import rebuild_like_counts
+from likes.models import LikedPlace
+from tags.index import indexes as tag_indexes
+from tags.models import Tag, TaggedPlace
+from .metrics import QueryRecorder
+
+WORDS = [
+    'beach', 'temple', 'market', 'museum', 'garden', 'island', 'river', 'lake',
+    'mountain', 'waterfall', 'cave', 'palace', 'fort', 'harbour', 'bridge',
+    'tower', 'cathedral', 'mosque', 'bazaar', 'park', 'forest', 'valley',
+    'hill', 'bay', 'village', 'old', 'town', 'night', 'street', 'food', 'tea',
+    'coffee', 'spice', 'heritage', 'colonial', 'royal', 'hidden', 'sunset',
+    'coral', 'reef', 'jungle', 'trail', 'hot', 'spring', 'rice', 'terrace',
+    'lighthouse', 'square', 'gallery', 'zoo', 'aquarium', 'festival', 'craft',
+    'silk', 'floating', 'sky', 'golden', 'grand', 'little', 'ancient',
+]
+VISIT_TYPE_WEIGHTS = {'L': 2, 'H': 5, 'B': 2, 'E': 1}
+RATING_WEIGHTS = {1: 1, 2: 2, 3: 5, 4: 9, 5: 7}
+
+DEFAULT_SCALE = {
+    'countries': 50,
+    'states': 500,
+    'places': 10000,
+    'members': 1000,
+    'visitors': 100000,
+    'trips': 2000,
+    'trip_places': 8,
+    'tags': 60,
+    'tags_per_place': 3,
+    'likes': 20000,
+}
+
+
+class Seeder:
+    """
+    Deterministic benchmark data written with bulk_create. Derived data
+    (review aggregates, like counts, search terms, trending scores) is
+    rebuilt afterwards because bulk_create skips the signals that keep it.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, log=print):
+        self.rng = random.Random(seed)
+        self.prefix = f'bench{seed}'
+        self.batch_size = batch_size
+        self.log = log
+        self.now = timezone.now()
+
+    def choices(self, weights, k):
+        return self.rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(total, start + self.batch_size))
+
+    def saved_ids(self, model, objects, key, values):
+        # Ids of rows just bulk created, where the backend does not return them
+        if connection.features.can_return_rows_from_bulk_insert:
+            return [obj.pk for obj in objects]
+        ids = dict(model.objects.filter(**{f'{key}__in': values}).values_list(key, 'pk'))
+        return [ids[value] for value in values]
+
+    def bulk_create_dated(self, model, objects, batch_size=None):
+        # created_at is auto_now_add, so bulk_create writes the current time;
+        # the seeded values are written over it afterwards
+        if not objects:
+            return
+        created = [obj.created_at for obj in objects]
+        model.objects.bulk_create(objects, batch_size=batch_size)
+        if objects[0].pk is None:
+            # The backend did not return the ids; the rows just inserted
+            # are the newest
+            ids = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)]
+            for obj, pk in zip(objects, reversed(list(ids))):
+                obj.pk = pk
+        for obj, created_at in zip(objects, created):
+            obj.created_at = created_at
+        fast_bulk_update(objects, ['created_at'])
+
+    def exists(self):
+        # Rows of an earlier run with this seed, whose slugs, emails and
+        # trip ids would collide
+        return Place.objects.filter(slug__startswith=f'{self.prefix}-place-').exists() or \
+            get_user_model().objects.filter(username__startswith=f'{self.prefix}-user-').exists()
+
+    def run(self, **scale):
+        scale = {**DEFAULT_SCALE, **scale}
+        started = time.monotonic()
+        self.seed_regions(scale['countries'], scale['states'])
+        self.seed_places(scale['places'])
+        self.seed_members(scale['members'])
+        self.seed_visitors(scale['visitors'])
+        self.seed_trips(scale['trips'], scale['trip_places'])
+        self.seed_tags(scale['tags'], scale['tags_per_place'])
+        self.seed_likes(scale['likes'])
+        self.log('Rebuilding derived data')
+        rebuild_rating_aggregates()
+        rebuild_like_counts(Place)
+        trending.rebuild_trends()
+        cache.delete(search.STATS_CACHE_KEY)
+        for index in tag_indexes:
+            index.invalidate()
+        response_cache.invalidate()
+        self.log(f'Seeded in {time.monotonic() - started:.1f}s')
+        return scale
+
+    def seed_regions(self, countries, states):
+        self.countries = []
+        objects = [
+            Country(code=f'{i:03}', name=f'{self.prefix} country {i}',
+                    lat=round(self.rng.uniform(-50, 60), 6),
+                    lon=round(self.rng.uniform(-170, 170), 6))
+            for i in range(countries)
+        ]
+        Country.objects.bulk_create(objects)
+        ids = self.saved_ids(Country, objects, 'name', [obj.name for obj in objects])
+        self.countries = [(country_id, float(obj.lat), float(obj.lon))
+                          for country_id, obj in zip(ids, objects)]
+
+        self.states = {}
+        objects, owners = [], []
+        for i in range(states):
+            country = self.rng.choice(self.countries)
+            objects.append(State(
+                name=f'{self.prefix} state {i}',
+                lat=round(country[1] + self.rng.gauss(0, 2), 6),
+                lon=round(country[2] + self.rng.gauss(0, 2), 6)))
+            owners.append(country[0])
+        State.objects.bulk_create(objects)
+        ids = self.saved_ids(State, objects, 'name', [obj.name for obj in objects])
+        for state_id, country_id in zip(ids, owners):
+            self.states.setdefault(country_id, []).append(state_id)
+        self.log(f'{countries} countries, {states} states')
+
+    def seed_places(self, total):
+        self.place_ids = []
+        for batch in self.batches(total):
+            places, addresses = [], []
+            for i in batch:
+                country_id, lat, lon = self.rng.choice(self.countries)
+                place = Place(
+                    name=f'{self.words(1, 3).title()} {i}',
+                    description=self.words(8, 30),
+                    lat=round(min(89, max(-89, lat + self.rng.gauss(0, 3))), 6),
+                    lon=round((lon + self.rng.gauss(0, 3) + 180) % 360 - 180, 6),
+                    slug=f'{self.prefix}-place-{i}',
+                    status='A')
+                place.geohash = geo.encode(float(place.lat), float(place.lon))
+                places.append(place)
+                states = self.states.get(country_id)
+                addresses.append((country_id, self.rng.choice(states) if states else None))
+            with transaction.atomic():
+                Place.objects.bulk_create(places)
+                ids = self.saved_ids(Place, places, 'slug', [place.slug for place in places])
+                for place, place_id in zip(places, ids):
+                    place.id = place_id
+                Address.objects.bulk_create([
+                    Address(place_id=place.id, street=f'{self.rng.randint(1, 999)} {self.words(1, 2)} road',
+                            city=self.words(1, 1).title(), country_id=country_id, state_id=state_id)
+                    for place, (country_id, state_id) in zip(places, addresses)])
+                PlaceSearchTerm.objects.bulk_create(
+                    [term for place in places for term in search.build_terms(place)],
+                    batch_size=self.batch_size)
+            self.place_ids.extend(ids)
+        self.log(f'{total} places')
+
+    def hot_place(self):
+        # Long tailed popularity: a few places get most of the activity
+        index = int(len(self.place_ids) * (self.rng.paretovariate(1.2) - 1) / 20)
+        return self.place_ids[index % len(self.place_ids)]
+
+    def seed_members(self, total):
+        User = get_user_model()
+        password = make_password(self.prefix)
+        self.member_ids = []
+        for batch in self.batches(total):
+            users = [User(username=f'{self.prefix}-user-{i}', email=f'{self.prefix}-user-{i}@example.com',
+                          first_name=self.words(1, 1).title(), last_name=self.words(1, 1).title(),
+                          password=password)
+                     for i in batch]
+            User.objects.bulk_create(users)
+            user_ids = self.saved_ids(User, users, 'username', [user.username for user in users])
+            members = [Member(user_id=user_id) for user_id in user_ids]
+            Member.objects.bulk_create(members)
+            self.member_ids.extend(self.saved_ids(Member, members, 'user_id', user_ids))
+        self.log(f'{total} members')
+
+    def past(self, days):
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def seed_visitors(self, total):
+        for batch in self.batches(total):
+            ratings = self.choices(RATING_WEIGHTS, len(batch))
+            visit_types = self.choices(VISIT_TYPE_WEIGHTS, len(batch))
+            visitors = [
+                Visitor(place_id=self.hot_place(),
+                        user_id=self.rng.choice(self.member_ids),
+                        rating=rating,
+                        review=self.words(5, 25),
+                        visit_type=visit_type,
+                        created_at=self.past(90))
+                for rating, visit_type in zip(ratings, visit_types)]
+            self.bulk_create_dated(Visitor, visitors)
+        self.log(f'{total} visitors')
+
+    def seed_trips(self, total, places_per_trip):
+        self.trip_ids = []
+        for batch in self.batches(total):
+            trips = [Trip(id=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+                          user_id=self.rng.choice(self.member_ids),
+                          created_at=self.past(365))
+                     for _ in batch]
+            self.bulk_create_dated(Trip, trips)
+            trip_places = []
+            for trip in trips:
+                start = date(2024, 1, 1) + timedelta(days=self.rng.randint(0, 700))
+                count = self.rng.randint(1, places_per_trip * 2)
+                for place_id in set(self.hot_place() for _ in range(count)):
+                    trip_places.append(TripPlace(
+                        trip_id=trip.id, place_id=place_id,
+                        date=start + timedelta(days=self.rng.randint(0, 6)),
+                        duration=self.rng.choice([1, 1.5, 2, 3, 4]),
+                        created_at=self.past(30)))
+            self.bulk_create_dated(TripPlace, trip_places, self.batch_size)
+            self.trip_ids.extend(trip.id for trip in trips)
+        self.log(f'{total} trips')
+
+    def seed_tags(self, total, per_place):
+        labels = WORDS[:total] + \
+            [f'{self.prefix}-tag-{i}' for i in range(max(0, total - len(WORDS)))]
+        existing = set(Tag.objects.filter(label__in=labels).values_list('label', flat=True))
+        Tag.objects.bulk_create([Tag(label=label) for label in labels if label not in existing])
+        tag_ids = list(Tag.objects.filter(label__in=labels).values_list('id', flat=True))
+        content_type = ContentType.objects.get_for_model(Place)
+        for start in range(0, len(self.place_ids), self.batch_size):
+            TaggedPlace.objects.bulk_create([
+                TaggedPlace(tag_id=tag_id, content_type=content_type, object_id=place_id)
+                for place_id in self.place_ids[start:start + self.batch_size]
+                for tag_id in self.rng.sample(tag_ids, min(len(tag_ids), self.rng.randint(0, per_place)))])
+        self.log(f'{len(tag_ids)} tags')
+
+    def seed_likes(self, total):
+        content_type = ContentType.objects.get_for_model(Place)
+        seen = set()
+        for batch in self.batches(total):
+            likes = []
+            for _ in batch:
+                pair = (self.rng.choice(self.member_ids), self.hot_place())
+                if pair not in seen:
+                    seen.add(pair)
+                    likes.append(LikedPlace(user_id=pair[0], content_type=content_type,
+                                            object_id=pair[1]))
+            LikedPlace.objects.bulk_create(likes, ignore_conflicts=True)
+        self.log(f'{len(seen)} likes')
+
+
+def percentile(values, percent):
+    # Nearest rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Scenario:
+    def __init__(self, name, method, path, data=None):
+        self.name = name
+        self.method = method
+        # `path` and `data` are callables taking the iteration number
+        self.path = path
+        self.data = data
+
+
+class Runner:
+    """
+    Drive the API in process through the Django test client and collect
+    latency, status and SQL query counts per scenario.
+    """
+
+    def __init__(self, seed=0, anonymous=False, host='localhost'):
+        self.rng = random.Random(seed)
+        self.anonymous = anonymous
+        self.host = host
+        # Random primary keys rather than ORDER BY RAND() over big tables
+        bounds = Place.objects.aggregate(low=Min('id'), high=Max('id'))
+        candidates = [self.rng.randint(bounds['low'], bounds['high'])
+                      for _ in range(2000)] if bounds['low'] is not None else []
+        sample = Place.objects.filter(id__in=candidates).values_list('id', 'lat', 'lon')
+        self.place_ids = [place_id for place_id, _, _ in sample]
+        self.points = [(lat, lon) for _, lat, lon in sample]
+        self.trip_ids = list(Trip.objects.values_list('id', flat=True)[:200])
+        self.tags = list(Tag.objects.values_list('label', flat=True)[:20])
+        self.member = Member.objects.select_related('user').order_by('id').first()
+
+    def client(self):
+        client = Client(SERVER_NAME=self.host)
+        if not self.anonymous and self.member is not None:
+            token = AccessToken.for_user(self.member.user)
+            client.defaults['HTTP_AUTHORIZATION'] = f'JWT {token}'
+        return client
+
+    def pick(self, items):
+        return self.rng.choice(items)
+
+    def scenarios(self):
+        place = lambda i: self.pick(self.place_ids)
+        scenarios = [
+            Scenario('place-list', 'get', lambda i: '/countries/places/?page_size=20'),
+            Scenario('place-list-by-rating', 'get',
+                     lambda i: '/countries/places/?page_size=20&ordering=-rating'),
+            Scenario('place-search', 'get',
+                     lambda i: f'/countries/places/?search={self.pick(WORDS)}+{self.pick(WORDS)}'),
+            Scenario('place-near', 'get', lambda i: '/countries/places/?near={},{}&radius_km=50'.format(
+                *self.pick(self.points))),
+            Scenario('place-tags', 'get',
+                     lambda i: f'/countries/places/?tags_any={self.pick(self.tags)},{self.pick(self.tags)}'),
+            Scenario('place-detail', 'get', lambda i: f'/countries/places/{place(i)}/'),
+            Scenario('place-trending', 'get', lambda i: '/countries/places/trending/'),
+            Scenario('place-visitors', 'get', lambda i: f'/countries/places/{place(i)}/visitors/'),
+            Scenario('place-visitor-stats', 'get',
+                     lambda i: f'/countries/places/{place(i)}/visitors/stats/'),
+            Scenario('async-place-list', 'get', lambda i: '/countries/async/places/?page_size=20'),
+            Scenario('async-place-detail', 'get', lambda i: f'/countries/async/places/{place(i)}/'),
+        ]
+        if self.trip_ids:
+            scenarios.append(Scenario(
+                'trip-detail', 'get', lambda i: f'/countries/trips/{self.pick(self.trip_ids)}/'))
+            scenarios.append(Scenario(
+                'async-trip-detail', 'get',
+                lambda i: f'/countries/async/trips/{self.pick(self.trip_ids)}/'))
+        return scenarios
+
+    def measure(self, client, method, path, data=None):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = getattr(client, method)(path, data, content_type='application/json') \
+                if data is not None else getattr(client, method)(path)
+        return time.perf_counter() - started, response, recorder
+
+    def run_scenario(self, scenario, requests, warmup, concurrency):
+        paths = [(scenario.path(i), scenario.data(i) if scenario.data else None)
+                 for i in range(warmup + requests)]
+        client = self.client()
+        for path, data in paths[:warmup]:
+            self.measure(client, scenario.method, path, data)
+
+        def work(chunk):
+            client = self.client()
+            try:
+                return [self.measure(client, scenario.method, path, data) for path, data in chunk]
+            finally:
+                connection.close()
+
+        timed = paths[warmup:]
+        started = time.perf_counter()
+        if concurrency > 1:
+            chunks = [timed[i::concurrency] for i in range(concurrency)]
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = [result for chunk in pool.map(work, chunks) for result in chunk]
+        else:
+            results = [self.measure(client, scenario.method, path, data) for path, data in timed]
+        return summarize(results, time.perf_counter() - started)
+
+    def run_trip_place_crud(self, requests):
+        # Create, update and delete trip places on a trip of the benchmark member
+        trip = Trip.objects.create(user=self.member)
+        client = self.client()
+        created, updated, deleted = [], [], []
+        for i in range(requests):
+            day = date(2030, 1, 1) + timedelta(days=i)
+            result = self.measure(client, 'post', f'/countries/trips/{trip.id}/places/', {
+                'place_id': self.pick(self.place_ids), 'duration': '2.00', 'date': day.isoformat()})
+            created.append(result)
+            if result[1].status_code != 201:
+                continue
+            trip_place_id = result[1].json()['id']
+            path = f'/countries/trips/{trip.id}/places/{trip_place_id}/'
+            updated.append(self.measure(client, 'patch', path, {
+                'place_id': result[1].json()['place_id'], 'duration': '3.00',
+                'date': (day + timedelta(days=5000)).isoformat()}))
+            deleted.append(self.measure(client, 'delete', path))
+        trip.delete()
+        return {
+            'trip-place-create': summarize(created),
+            'trip-place-update': summarize(updated),
+            'trip-place-delete': summarize(deleted),
+        }
+
+    def run(self, requests=200, warmup=20, concurrency=1, only=None):
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'anonymous': self.anonymous,
+            'requests': requests,
+            'concurrency': concurrency,
+            'rows': {model.__name__: model.objects.count()
+                     for model in (Place, Visitor, Trip, TripPlace, TaggedPlace, LikedPlace)},
+            'scenarios': {},
+        }
+        for scenario in self.scenarios():
+            if only and scenario.name not in only:
+                continue
+            report['scenarios'][scenario.name] = self.run_scenario(
+                scenario, requests, warmup, concurrency)
+        if self.member is not None and not self.anonymous and (not only or 'trip-place-crud' in only):
+            report['scenarios'].update(self.run_trip_place_crud(requests))
+        connections.close_all()
+        return report
+
+
+def summarize(results, elapsed=None):
+    if not results:
+        return {'requests': 0}
+    latencies = [seconds * 1000 for seconds, _, _ in results]
+    queries = [recorder.count for _, _, recorder in results]
+    if elapsed is None:
+        elapsed = sum(seconds for seconds, _, _ in results)
+    return {
+        'requests': len(results),
+        'status': dict(Counter(str(response.status_code) for _, response, _ in results)),
+        'rps': round(len(results) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'sql_ms_mean': round(sum(recorder.seconds for _, _, recorder in results) * 1000 / len(results), 2),
+    }
@@ -0,0 +1,34 @@
+import json
+from django.core.management.base import BaseCommand
+from core.benchmark import Runner
+
+
+class Command(BaseCommand):
+    help = 'Time the main API endpoints and print a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Send no credentials (served from the response cache)')
+        parser.add_argument('--only', default='',
+                            help='Comma separated scenario names')
+        parser.add_argument('--host', default='localhost',
+                            help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--output', help='Write the report to this file')
+
+    def handle(self, *args, **options):
+        runner = Runner(seed=options['seed'], anonymous=options['anonymous'],
+                        host=options['host'])
+        only = {name for name in options['only'].split(',') if name}
+        report = runner.run(requests=options['requests'], warmup=options['warmup'],
+                            concurrency=options['concurrency'], only=only)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import DEFAULT_SCALE, Seeder
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with deterministic benchmark data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+
+    def handle(self, *args, **options):
+        seeder = Seeder(seed=options['seed'], batch_size=options['batch_size'],
+                        log=self.stdout.write)
+        if seeder.exists():
+            raise CommandError(f'Benchmark data for seed {options["seed"]} already exists. '
+                               'Use another --seed or an empty database.')
+        seeder.run(**{name: options[name] for name in DEFAULT_SCALE})
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,172 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Duplicate fingerprints kept per process, and how many are exported
+MAX_FINGERPRINTS = 2000
+TOP_FINGERPRINTS = 20
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+SELECT_LIST = re.compile(r'^SELECT .*? FROM ', re.DOTALL)
+WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    # Parameters are already placeholders. Fold IN lists of any length and
+    # the column list so the label shows the part that tells queries apart.
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = SELECT_LIST.sub('SELECT ... FROM ', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class QueryRecorder:
+    """
+    `connection.execute_wrapper` callable counting the queries of one
+    request, their total time and how often each SQL template ran.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.templates = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.templates[sql] = self.templates.get(sql, 0) + 1
+
+
+class Registry:
+    """
+    Per-process request metrics by URL name, rendered in the Prometheus
+    text format. Each worker process keeps its own numbers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.latency = {}
+            self.queries = {}
+            self.query_seconds = {}
+            self.duplicates = {}
+
+    def record(self, route, method, status, seconds, recorder):
+        executions = {}
+        for sql, count in recorder.templates.items():
+            key = (route, fingerprint(sql))
+            executions[key] = executions.get(key, 0) + count
+        duplicates = {key: count - 1 for key, count in executions.items() if count > 1}
+        key = (route, method)
+        with self._lock:
+            status_key = (route, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.query_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(recorder.count)
+            self.query_seconds[key] += recorder.seconds
+            for duplicate_key, count in duplicates.items():
+                self.duplicates[duplicate_key] = self.duplicates.get(duplicate_key, 0) + count
+            if len(self.duplicates) > MAX_FINGERPRINTS:
+                self._prune_duplicates()
+
+    def _prune_duplicates(self):
+        # Keep the most frequent half
+        ranked = sorted(self.duplicates.items(), key=lambda item: item[1], reverse=True)
+        self.duplicates = dict(ranked[:MAX_FINGERPRINTS // 2])
+
+    def render(self):
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {key: self._copy(value) for key, value in self.latency.items()}
+            queries = {key: self._copy(value) for key, value in self.queries.items()}
+            query_seconds = dict(self.query_seconds)
+            duplicates = sorted(self.duplicates.items(),
+                                key=lambda item: item[1], reverse=True)[:TOP_FINGERPRINTS]
+
+        lines = []
+        lines += header('http_requests_total', 'counter', 'Requests by URL name, method and status.')
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(sample('http_requests_total',
+                                {'route': route, 'method': method, 'status': status}, count))
+        lines += histogram_lines('http_request_duration_seconds',
+                                 'Request latency by URL name.', latency)
+        lines += histogram_lines('db_queries_per_request',
+                                 'SQL queries per request by URL name.', queries)
+        lines += header('db_query_duration_seconds_total', 'counter',
+                        'Time spent in SQL by URL name.')
+        for (route, method), seconds in sorted(query_seconds.items()):
+            lines.append(sample('db_query_duration_seconds_total',
+                                {'route': route, 'method': method}, seconds))
+        lines += header('db_duplicate_queries_total', 'counter',
+                        'Repeated executions of the same SQL within one request.')
+        for (route, sql), count in duplicates:
+            lines.append(sample('db_duplicate_queries_total',
+                                {'route': route, 'fingerprint': sql[:300]}, count))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _copy(histogram):
+        copy = Histogram(histogram.buckets)
+        copy.counts = list(histogram.counts)
+        copy.sum = histogram.sum
+        copy.count = histogram.count
+        return copy
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def sample(name, labels, value):
+    rendered = ','.join(f'{key}="{escape(label)}"' for key, label in labels.items())
+    return f'{name}{{{rendered}}} {value}'
+
+
+def header(name, kind, help_text):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+
+
+def histogram_lines(name, help_text, histograms):
+    lines = header(name, 'histogram', help_text)
+    for (route, method), histogram in sorted(histograms.items()):
+        labels = {'route': route, 'method': method}
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(sample(f'{name}_bucket', {**labels, 'le': bound}, cumulative))
+        lines.append(sample(f'{name}_bucket', {**labels, 'le': '+Inf'}, histogram.count))
+        lines.append(sample(f'{name}_sum', labels, histogram.sum))
+        lines.append(sample(f'{name}_count', labels, histogram.count))
+    return lines
+
+
+registry = Registry()
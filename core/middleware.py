@@ -0,0 +1,119 @@
+import math
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from .metrics import QueryRecorder, registry
+from .routers import PIN_SECONDS, replicas, use_replica
+
+PIN_COOKIE = 'primary_until'
+PIN_HEADER = 'X-Primary-Until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def wrap_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+class MetricsMiddleware:
+    """
+    Record latency and SQL usage of every request under its URL name in
+    `core.metrics.registry`, exported by the `metrics` view. Put it first
+    in MIDDLEWARE so the timing covers the rest of the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # Connections belong to a thread, and the ORM of async views and the
+        # sync views under ASGI run in the request's sync thread, so the
+        # wrappers are installed and removed there
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(wrap_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    def record(self, request, response, seconds, recorder):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else '<unresolved>'
+        registry.record(route, request.method, response.status_code, seconds, recorder)
+
+
+class ReplicaMiddleware:
+    """
+    Send the reads of safe-method requests to a replica (see
+    core.routers) unless the client wrote within REPLICA_PIN_SECONDS.
+    A successful write pins the client to the primary for that long: the
+    response sets the `PIN_COOKIE` cookie and the `PIN_HEADER` header,
+    which clients that do not keep cookies send back.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias = replicas.choose() if self.reads_replica(request) else None
+        with use_replica(alias):
+            response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # Health checks query the replicas, so the choice is made in the
+        # sync thread; the ORM calls of the view inherit the context
+        alias = None
+        if self.reads_replica(request):
+            alias = await sync_to_async(replicas.choose)()
+        with use_replica(alias):
+            response = await self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    def reads_replica(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        value = request.COOKIES.get(PIN_COOKIE) or request.headers.get(PIN_HEADER)
+        try:
+            until = float(value)
+        except (TypeError, ValueError):
+            return True
+        # A pin never lasts longer than a fresh one would (rounded up to
+        # the second)
+        now = time.time()
+        return not now < until <= now + PIN_SECONDS + 1
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not replicas.weights:
+            return
+        until = str(math.ceil(time.time() + PIN_SECONDS))
+        response.set_cookie(PIN_COOKIE, until, max_age=PIN_SECONDS + 1, httponly=True, samesite='Lax')
+        response[PIN_HEADER] = until
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Clients that wrote read from the primary for this long, and replicas are
+# assumed to have caught up after it
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+# Replica the reads of the current request go to, None for the primary.
+# Set by core.middleware.ReplicaMiddleware
+_replica = ContextVar('replica', default=None)
+
+
+def current_replica():
+    return _replica.get()
+
+
+@contextmanager
+def use_replica(alias):
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaPool:
+    """
+    Weighted random choice among the replicas that passed their last
+    health check. A replica is checked with `SELECT 1` at most once per
+    `check_interval` seconds; with none healthy, reads stay on the primary.
+    """
+
+    def __init__(self, weights, check_interval=10):
+        self.weights = dict(weights)
+        self.check_interval = check_interval
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        healthy = [alias for alias, weight in self.weights.items()
+                   if weight > 0 and self.is_healthy(alias)]
+        if not healthy:
+            return None
+        return random.choices(healthy, [self.weights[alias] for alias in healthy])[0]
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked_at = self._health.get(alias, (None, None))
+            if healthy is not None and now - checked_at < self.check_interval:
+                return healthy
+            # Others keep the last result while this thread checks
+            self._health[alias] = (bool(healthy), now)
+        healthy = self.check(alias)
+        with self._lock:
+            self._health[alias] = (healthy, now)
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except DatabaseError:
+            try:
+                connection.close()
+            except DatabaseError:
+                pass
+            return False
+
+
+replicas = ReplicaPool(getattr(settings, 'DATABASE_REPLICAS', {}),
+                       getattr(settings, 'REPLICA_CHECK_INTERVAL', 10))
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary (`default`). Reads go to the replica chosen
+    for the request, except inside a transaction on the primary, which
+    has to see its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas.weights}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        if db in replicas.weights:
+            return False
+        return None
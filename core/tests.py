@@ -1,3 +1,95 @@
-from django.test import TestCase
+import time
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from countries.models import Place
+from .middleware import PIN_COOKIE, PIN_HEADER, ReplicaMiddleware
+from .routers import ReplicaPool
 
-# Create your tests here.
+REPLICA = 'replica'
+SMALL_SCALE = {'countries': 2, 'states': 3, 'places': 20, 'members': 5, 'visitors': 30,
+               'trips': 3, 'trip_places': 2, 'tags': 4, 'tags_per_place': 2, 'likes': 10}
+
+
+class SeedBenchmarkTests(TestCase):
+    def seed(self, seed):
+        call_command('seed_benchmark', seed=seed, stdout=StringIO(), **SMALL_SCALE)
+
+    def test_seeding_the_same_seed_twice_fails_early(self):
+        self.seed(0)
+        places = Place.objects.count()
+        with self.assertRaisesMessage(CommandError, 'seed 0 already exists'):
+            self.seed(0)
+        self.assertEqual(Place.objects.count(), places)
+        self.seed(1)
+        self.assertEqual(Place.objects.count(), places + SMALL_SCALE['places'])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not a TestCase: reads inside its transaction always stay on the
+    # primary. The replica alias is the primary's connection, as with a
+    # TEST MIRROR, so the alias rows were loaded from shows the routing
+    def setUp(self):
+        connections[REPLICA] = connections[DEFAULT_DB_ALIAS]
+        self.addCleanup(connections.__delitem__, REPLICA)
+        self.pool = ReplicaPool({REPLICA: 1})
+        for target in ['core.middleware.replicas', 'core.routers.replicas']:
+            patcher = mock.patch(target, self.pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.place = Place.objects.create(
+            name='Harbour', slug='harbour', lat=Decimal('1.28'), lon=Decimal('103.85'))
+        self.middleware = ReplicaMiddleware(self.view)
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        if request.method == 'POST':
+            if 'fail' in request.POST:
+                return HttpResponse(status=400)
+            Place.objects.filter(pk=self.place.pk).update(name='Quay')
+            return HttpResponse(status=201)
+        return HttpResponse(Place.objects.get(pk=self.place.pk)._state.db)
+
+    def read(self, **extra):
+        return self.middleware(self.factory.get('/', **extra)).content.decode()
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.read(), REPLICA)
+        response = self.middleware(self.factory.get('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        response = self.middleware(self.factory.post('/'))
+        until = response[PIN_HEADER]
+        self.assertEqual(response.cookies[PIN_COOKIE].value, until)
+        self.factory.cookies[PIN_COOKIE] = until
+        self.assertEqual(self.read(), DEFAULT_DB_ALIAS)
+        del self.factory.cookies[PIN_COOKIE]
+        # Clients without cookies send the header back
+        self.assertEqual(self.read(HTTP_X_PRIMARY_UNTIL=until), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.read(), REPLICA)
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.read(), DEFAULT_DB_ALIAS)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.middleware(self.factory.post('/', {'fail': 1}))
+        self.assertFalse(response.has_header(PIN_HEADER))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_expired_or_too_long_pin_is_ignored(self):
+        for until in [time.time() - 1, time.time() + 3600, 'soon']:
+            self.assertEqual(self.read(HTTP_X_PRIMARY_UNTIL=str(until)), REPLICA)
+
+    def test_unhealthy_replica_falls_back_to_the_primary(self):
+        with mock.patch.object(self.pool, 'check', return_value=False):
+            self.assertEqual(self.read(), DEFAULT_DB_ALIAS)
+        # The failed check is remembered for check_interval seconds
+        self.assertEqual(self.read(), DEFAULT_DB_ALIAS)
+        self.pool.check_interval = 0
+        self.assertEqual(self.read(), REPLICA)
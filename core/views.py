@@ -1,3 +1,17 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from .metrics import registry
+
+# Loopback only unless METRICS_ALLOWED_IPS says otherwise
+DEFAULT_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
 
 # Create your views here.
+
+
+def metrics(request):
+    # Prometheus scrape endpoint, limited to METRICS_ALLOWED_IPS
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', DEFAULT_METRICS_ALLOWED_IPS)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
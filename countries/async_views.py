@@ -0,0 +1,200 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+from core.authentication import AsyncJWTAuthentication
+from countries.cache import CACHED_HEADERS
+from likes.models import LikedPlace
+from tags.models import TaggedPlace
+from .models import Place, Trip
+from .serializers import FastPlaceListSerializer, untagged_places
+from .views import PlaceViewSet, TripViewSet
+
+class AsyncReadView(View):
+    """
+    Async GET for the `list` or `retrieve` action of `viewset_class`. The
+    viewset still supplies the queryset, filters, pagination, serializer,
+    permissions and ETag versions; only the reads are awaited, so under
+    ASGI a request waiting on the database or a slow client does not hold
+    a worker thread. Writes stay on the sync viewsets.
+
+    Subclasses implement `get_version` (cheap validators, as in
+    ConditionalGetMixin) and `get_data` (the serialized response body).
+    """
+    viewset_class = None
+    action = None
+    http_method_names = ['get', 'head', 'options']
+    authenticator = AsyncJWTAuthentication()
+
+    async def get(self, request, **kwargs):
+        request = Request(request)
+        viewset = self.viewset_class(
+            request=request, args=(), kwargs=kwargs,
+            action=self.action, format_kwarg=None)
+        self.renderer = next(renderer for renderer in viewset.get_renderers()
+                             if renderer.format == 'json')
+        request.accepted_renderer = self.renderer
+        request.accepted_media_type = self.renderer.media_type
+        try:
+            authenticated = await self.authenticator.aauthenticate(request)
+            request.user, request.auth = authenticated or (AnonymousUser(), None)
+            viewset.check_permissions(request)
+            return await self.cached(viewset)
+        except Exception as exc:
+            return self.handle_exception(request, exc)
+
+    async def cached(self, viewset):
+        # Same anonymous response cache as CachedReadMixin
+        cache = getattr(viewset, 'response_cache', None)
+        request = viewset.request
+        if cache is None or request.user.is_authenticated:
+            return await self.respond(viewset)
+
+        key = cache.key(request, await cache.ageneration())
+        entry = await cache.aget(key)
+        if entry is not None:
+            data, headers = entry
+            response = get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')))
+            if response is None:
+                response = self.render(data)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        response = await self.respond(viewset)
+        if response.status_code == 200:
+            headers = {name: response[name]
+                       for name in CACHED_HEADERS if response.has_header(name)}
+            await cache.aset(key, response.data, headers)
+        return response
+
+    async def respond(self, viewset):
+        not_modified, headers = viewset.check_conditions(await self.get_version(viewset))
+        if not_modified is not None:
+            return not_modified
+        response = self.render(await self.get_data(viewset))
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    async def get_version(self, viewset):
+        return None
+
+    async def get_data(self, viewset):
+        raise NotImplementedError
+
+    def render(self, data, status=200):
+        response = HttpResponse(
+            self.renderer.render(data), status=status, content_type=self.renderer.media_type)
+        response.data = data
+        return response
+
+    def handle_exception(self, request, exc):
+        # DRF's error bodies and status codes, as APIView.handle_exception
+        error = exception_handler(exc, {'request': request, 'view': self})
+        if error is None:
+            raise exc
+        response = self.render(error.data, status=error.status_code)
+        if error.has_header('Retry-After'):
+            response['Retry-After'] = error['Retry-After']
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.authenticator.authenticate_header(request)
+        return response
+
+
+async def prefetch_places(places, viewset):
+    # What PlaceListSerializer would load, read ahead of serializing
+    fields = viewset.get_serializer().fields
+    if 'tags' in fields:
+        places = await TaggedPlace.objects.aprefetch_tags(places)
+    if 'is_liked' in fields:
+        places = await LikedPlace.objects.aprefetch_liked(places, viewset.request.user)
+    return places
+
+
+class PlaceListView(AsyncReadView):
+    viewset_class = PlaceViewSet
+    action = 'list'
+
+    async def get_version(self, viewset):
+        # Some filters look rows up while the queryset is being built
+        self.queryset = await sync_to_async(viewset.filter_queryset)(
+            viewset.get_queryset())
+        return await viewset.aget_list_version(self.queryset)
+
+    async def get_data(self, viewset):
+        if viewset.fast_list() and not viewset.get_expand_names():
+            return await self.get_fast_data(viewset)
+        paginator = viewset.paginator
+        page = None
+        if paginator is not None:
+            page = await paginator.apaginate_queryset(
+                self.queryset, viewset.request, view=viewset)
+        if page is None:
+            places = [place async for place in self.queryset]
+        else:
+            places = page
+        places = await prefetch_places(places, viewset)
+        data = viewset.get_serializer(places, many=True).data
+        if page is None:
+            return data
+        return paginator.get_paginated_response(data).data
+
+    async def get_fast_data(self, viewset):
+        # As PlaceViewSet.get_list_response
+        paginator = viewset.paginator
+        serializer = FastPlaceListSerializer(viewset.get_serializer_context())
+        ordering, page = [], None
+        if paginator is not None:
+            ordering = [name for name, _ in paginator.get_keyset_ordering(self.queryset)]
+        rows = serializer.get_queryset(self.queryset, ordering)
+        if paginator is not None:
+            page = await paginator.apaginate_queryset(rows, viewset.request, view=viewset)
+        if page is None:
+            return await serializer.adata([row async for row in rows.aiterator()])
+        return paginator.get_paginated_response(await serializer.adata(page)).data
+
+
+class PlaceDetailView(AsyncReadView):
+    viewset_class = PlaceViewSet
+    action = 'retrieve'
+
+    async def get_version(self, viewset):
+        return await viewset.aget_object_version()
+
+    async def get_data(self, viewset):
+        try:
+            queryset = viewset.narrow_queryset(viewset.get_queryset())
+            place = await viewset.expand_queryset(queryset).aget(pk=viewset.kwargs['pk'])
+        except Place.DoesNotExist:
+            raise Http404('No Place matches the given query.')
+        viewset.check_object_permissions(viewset.request, place)
+        (place,) = await prefetch_places([place], viewset)
+        return viewset.get_serializer(place).data
+
+
+class TripDetailView(AsyncReadView):
+    viewset_class = TripViewSet
+    action = 'retrieve'
+
+    async def get_version(self, viewset):
+        return await viewset.aget_object_version()
+
+    async def get_data(self, viewset):
+        try:
+            trip = await viewset.narrow_queryset(viewset.get_queryset()) \
+                .aget(pk=viewset.kwargs['pk'])
+        except Trip.DoesNotExist:
+            raise Http404('No Trip matches the given query.')
+        viewset.check_object_permissions(viewset.request, trip)
+        if 'tags' in viewset.get_expand_names() and viewset.wants('places'):
+            await TaggedPlace.objects.aprefetch_tags(untagged_places([trip]))
+        return viewset.get_serializer(trip).data
@@ -0,0 +1,167 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.exceptions import ValidationError
+from countries import geo, search
+from countries.cache import response_cache
+from countries.models import Address, Country, Place, PlaceSearchTerm, State
+from countries.regions import fill_missing_many
+
+
+def resolve_ids(model, ids):
+    # One query per related model for the whole batch
+    if not ids:
+        return set()
+    return set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def upsert_places(serializer, rows, batch_size=1000):
+    """
+    Validate `rows` with `serializer` and create or update them, matching
+    existing places by slug. Returns one result dict per row, in order.
+    """
+    results = [None] * len(rows)
+    valid = {}
+    slugs = set()
+    for index, row in enumerate(rows):
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as error:
+            results[index] = {'status': 'error', 'errors': error.detail}
+            continue
+        data['slug'] = data.get('slug') or slugify(data.get('name', ''))
+        if not data['slug']:
+            results[index] = {'status': 'error',
+                              'errors': {'slug': ['A slug or name is required.']}}
+            continue
+        if data['slug'] in slugs:
+            results[index] = {'status': 'error',
+                              'errors': {'slug': ['Duplicate slug in request.']}}
+            continue
+        slugs.add(data['slug'])
+        valid[index] = data
+
+    addresses = {index: data.pop('address_set') for index, data in valid.items()
+                 if data.get('address_set') is not None}
+    states = resolve_ids(State, {a['state_id'] for a in addresses.values() if a.get('state_id')})
+    countries = resolve_ids(Country, {a['country_id'] for a in addresses.values() if a.get('country_id')})
+    for index, address in list(addresses.items()):
+        errors = {}
+        if address.get('state_id') and address['state_id'] not in states:
+            errors['state_id'] = ['No state with the given ID was found.']
+        if address.get('country_id') and address['country_id'] not in countries:
+            errors['country_id'] = ['No country with the given ID was found.']
+        if errors:
+            results[index] = {'status': 'error', 'errors': {'address': errors}}
+            del valid[index]
+            del addresses[index]
+
+    with transaction.atomic():
+        existing = {place.slug: place for place in
+                    Place.objects.filter(slug__in=[d['slug'] for d in valid.values()])}
+
+        now = timezone.now()
+        to_create, to_update, update_fields = {}, {}, {'last_update', 'geohash'}
+        moved = set()
+        for index, data in valid.items():
+            place = existing.get(data['slug'])
+            if place is None:
+                if data.get('lat') is None or data.get('lon') is None:
+                    results[index] = {'status': 'error', 'errors': {
+                        'lat': ['This field is required.'],
+                        'lon': ['This field is required.']}}
+                    addresses.pop(index, None)
+                    continue
+                place = Place(status='A', **data)
+                to_create[index] = place
+            else:
+                if (data.get('lat', place.lat), data.get('lon', place.lon)) != (place.lat, place.lon):
+                    moved.add(index)
+                for key, value in data.items():
+                    setattr(place, key, value)
+                update_fields.update(data)
+                place.last_update = now
+                to_update[index] = place
+            place.geohash = geo.encode(float(place.lat), float(place.lon))
+
+        Place.objects.bulk_update(to_update.values(), update_fields,
+                                  batch_size=batch_size)
+        Place.objects.bulk_create(to_create.values(), batch_size=batch_size,
+                                  **conflict_options([valid[index] for index in to_create]))
+        # Ids are not returned on every backend or for conflicting rows. A
+        # slug another request inserted after the lookup above was updated
+        # instead, and its row kept that request's created_at
+        created = {slug: (place_id, created_at) for slug, place_id, created_at in
+                   Place.objects
+                   .filter(slug__in=[place.slug for place in to_create.values()])
+                   .values_list('slug', 'id', 'created_at')}
+        for index, place in list(to_create.items()):
+            place.id, created_at = created[place.slug]
+            if created_at != place.created_at:
+                # Columns this row left out keep the other request's values
+                place.refresh_from_db()
+                to_update[index] = to_create.pop(index)
+                moved.add(index)
+
+        places = {**to_create, **to_update}
+        save_addresses(places, addresses, moved, batch_size)
+
+        PlaceSearchTerm.objects.filter(
+            place_id__in=[place.id for place in places.values()]).delete()
+        PlaceSearchTerm.objects.bulk_create(
+            [term for place in places.values() for term in search.build_terms(place)],
+            batch_size=batch_size)
+        if places:
+            response_cache.invalidate()
+
+    for index, place in to_create.items():
+        results[index] = {'status': 'created', 'id': place.id, 'slug': place.slug}
+    for index, place in to_update.items():
+        results[index] = {'status': 'updated', 'id': place.id, 'slug': place.slug}
+    return results
+
+
+def conflict_options(rows):
+    """
+    bulk_create options that turn the insert of a slug created by another
+    request since it was looked up into an update of that place, instead of
+    an IntegrityError on the unique slug. Only the columns every new row
+    sets are written.
+    """
+    features = connection.features
+    if not rows or not features.supports_update_conflicts:
+        return {}
+    fields = set.intersection(*[set(row) for row in rows]) - {'slug'}
+    options = {'update_conflicts': True,
+               'update_fields': sorted(fields | {'geohash', 'last_update'})}
+    if features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['slug']
+    return options
+
+
+def save_addresses(places, addresses, moved, batch_size):
+    place_ids = [places[index].id for index in addresses]
+    existing = Address.objects.in_bulk(place_ids)
+    to_create, to_update, update_fields = [], [], set()
+    located = []
+    for index, data in addresses.items():
+        place = places[index]
+        address = existing.get(place.id)
+        if address is None:
+            address = Address(place_id=place.id, **data)
+            to_create.append(address)
+            located.append((address, place.lat, place.lon))
+        else:
+            for key, value in data.items():
+                setattr(address, key, value)
+            update_fields.update(data)
+            to_update.append(address)
+            if index in moved:
+                located.append((address, place.lat, place.lon))
+    # Regions left empty on new addresses and moved places come from the
+    # nearest centroids; a region cleared on purpose stays cleared
+    if any(address.place_id in existing for address in fill_missing_many(located)):
+        update_fields.update(['state_id', 'country_id'])
+    Address.objects.bulk_create(to_create, batch_size=batch_size)
+    if update_fields:
+        Address.objects.bulk_update(to_update, update_fields, batch_size=batch_size)
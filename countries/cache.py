@@ -0,0 +1,211 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+from core.routers import PIN_SECONDS, current_replica
+
+CACHED_HEADERS = ['ETag', 'Last-Modified']
+
+
+class LRUCache:
+    """
+    Process-local cache with per-entry expiry, evicting least recently used
+    entries once the stored size passes `max_bytes`.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, timeout):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, size, time.monotonic() + timeout)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+class ResponseCache:
+    """
+    Two level cache for anonymous read responses: a local LRU in front of a
+    shared Django cache. Keys embed a generation counter kept in the shared
+    cache; bumping it on writes invalidates every worker at once.
+    """
+
+    def __init__(self, alias='default', prefix='places', timeout=300,
+                 max_memory=32 * 1024 * 1024, max_entry_size=1024 * 1024):
+        self.alias = alias
+        self.prefix = prefix
+        self.timeout = timeout
+        self.max_entry_size = max_entry_size
+        self.local = LRUCache(max_memory)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    @property
+    def generation_key(self):
+        return f'{self.prefix}:generation'
+
+    @property
+    def invalidated_key(self):
+        return f'{self.prefix}:invalidated_at'
+
+    def generation(self):
+        generation = self.shared.get(self.generation_key)
+        if generation is None:
+            self.shared.add(self.generation_key, 1, None)
+            generation = self.shared.get(self.generation_key, 1)
+        return generation
+
+    async def ageneration(self):
+        generation = await self.shared.aget(self.generation_key)
+        if generation is None:
+            await self.shared.aadd(self.generation_key, 1, None)
+            generation = await self.shared.aget(self.generation_key, 1)
+        return generation
+
+    def invalidate(self):
+        # After commit, so no reader can cache pre-commit data under the new
+        # generation
+        transaction.on_commit(self._bump)
+
+    def _bump(self):
+        try:
+            self.shared.incr(self.generation_key)
+        except ValueError:
+            self.shared.add(self.generation_key, 2, None)
+        self.shared.set(self.invalidated_key, time.time(), None)
+
+    def settled(self, invalidated_at):
+        # Replicas may lag an invalidation by up to PIN_SECONDS, so what
+        # they return until then is not cached
+        return invalidated_at is None or time.time() - invalidated_at > PIN_SECONDS
+
+    def key(self, request, generation):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values)
+        # Hyperlinks in the body carry the scheme and host
+        raw = repr((request.scheme, request.get_host(), request.path, params,
+                    request.accepted_renderer.format))
+        digest = md5(raw.encode(), usedforsecurity=False).hexdigest()
+        return f'{self.prefix}:response:{generation}:{digest}'
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            payload = self.shared.get(key)
+            if payload is None:
+                return None
+            entry = pickle.loads(payload)
+            self.local.set(key, entry, len(payload), self.timeout)
+        return entry
+
+    async def aget(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            payload = await self.shared.aget(key)
+            if payload is None:
+                return None
+            entry = pickle.loads(payload)
+            self.local.set(key, entry, len(payload), self.timeout)
+        return entry
+
+    def set(self, key, data, headers):
+        if current_replica() is not None and \
+                not self.settled(self.shared.get(self.invalidated_key)):
+            return
+        payload = pickle.dumps((data, headers), pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_entry_size:
+            return
+        self.shared.set(key, payload, self.timeout)
+        self.local.set(key, (data, headers), len(payload), self.timeout)
+
+    async def aset(self, key, data, headers):
+        if current_replica() is not None and \
+                not self.settled(await self.shared.aget(self.invalidated_key)):
+            return
+        payload = pickle.dumps((data, headers), pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_entry_size:
+            return
+        await self.shared.aset(key, payload, self.timeout)
+        self.local.set(key, (data, headers), len(payload), self.timeout)
+
+
+response_cache = ResponseCache(**getattr(settings, 'PLACE_RESPONSE_CACHE', {}))
+
+
+class CachedReadMixin:
+    """
+    Serve `list` and `retrieve` for anonymous users from `response_cache`.
+    Cached ETag / Last-Modified headers still answer conditional requests.
+    """
+    response_cache = response_cache
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        key = self.response_cache.key(request, self.response_cache.generation())
+        entry = self.response_cache.get(key)
+        if entry is not None:
+            data, headers = entry
+            response = get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')))
+            if response is None:
+                response = Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name]
+                       for name in CACHED_HEADERS if response.has_header(name)}
+            self.response_cache.set(key, response.data, headers)
+        return response
@@ -0,0 +1,89 @@
+from hashlib import md5
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators. Validators come from cheap metadata
+    queries (`get_list_version`, `get_object_version`) so a matching
+    conditional request returns 304 before anything is serialized. Use
+    ConditionalListMixin and ConditionalRetrieveMixin for the actions; this
+    adds no routes of its own.
+
+    The version methods return `(parts, last_modified)` where `parts` is a
+    tuple of values identifying the current state, or `None` if unknown.
+    """
+
+    def get_list_version(self, queryset):
+        return None
+
+    def get_object_version(self):
+        return None
+
+    def get_etag(self, parts):
+        request = self.request
+        key = repr((
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            *parts,
+        ))
+        return 'W/"%s"' % md5(key.encode(), usedforsecurity=False).hexdigest()
+
+    def check_conditions(self, version):
+        # Returns (response_or_None, headers)
+        if version is None:
+            return None, {}
+        parts, last_modified = version
+        headers = {'ETag': self.get_etag(parts)}
+        timestamp = None
+        if last_modified is not None:
+            timestamp = int(last_modified.timestamp())
+            headers['Last-Modified'] = http_date(timestamp)
+        response = get_conditional_response(
+            self.request, etag=headers['ETag'], last_modified=timestamp)
+        if response is not None:
+            for name, value in headers.items():
+                response[name] = value
+        return response, headers
+
+
+class ConditionalListMixin(ConditionalGetMixin, ListModelMixin):
+    # Conditional `list`, validated by `get_list_version`
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        not_modified, headers = self.check_conditions(
+            self.get_list_version(queryset))
+        if not_modified is not None:
+            return not_modified
+
+        response = self.get_list_response(queryset)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def get_list_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class ConditionalRetrieveMixin(ConditionalGetMixin, RetrieveModelMixin):
+    # Conditional `retrieve`, validated by `get_object_version`
+
+    def retrieve(self, request, *args, **kwargs):
+        not_modified, headers = self.check_conditions(self.get_object_version())
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
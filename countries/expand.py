@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from countries.models import Visitor
+from countries.sparse import parse_names
+from tags.models import tags_prefetch
+
+EXPAND_PARAM = 'expand'
+# Reviews embedded per place by ?expand=visitors
+RECENT_VISITORS = getattr(settings, 'PLACE_EXPAND_VISITORS', 5)
+
+
+def expand_names(request, available):
+    """
+    The names in `available` given in `?expand=` on a read request, in
+    their original order.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return []
+    names = parse_names(request.query_params.get(EXPAND_PARAM))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValidationError({EXPAND_PARAM: f'Unknown expansions: {", ".join(unknown)}.'})
+    return [name for name in available if name in names]
+
+
+def recent_visitors(prefix=''):
+    # The latest reviews of every place in one query, numbered per place
+    # by a window function rather than sliced place by place
+    visitors = Visitor.objects \
+        .annotate(recent_rank=Window(
+            RowNumber(),
+            partition_by=F('place_id'),
+            order_by=[F('created_at').desc(), F('id').desc()])) \
+        .filter(recent_rank__lte=RECENT_VISITORS) \
+        .order_by('-created_at', '-id')
+    return Prefetch(prefix + 'visitor_set', queryset=visitors, to_attr='recent_visitors')
+
+
+class Expansion:
+    """
+    What one `?expand=` name needs loaded, relative to the expanded model:
+    `select` paths for select_related, `prefetch` lookups or callables
+    taking the path prefix and returning a Prefetch, and the `columns` to
+    add when the queryset was narrowed with only().
+    """
+
+    def __init__(self, select=(), prefetch=(), columns=()):
+        self.select = list(select)
+        self.prefetch = list(prefetch)
+        self.columns = list(columns)
+
+
+ADDRESS_RELATIONS = ['address_set', 'address_set__state', 'address_set__country']
+ADDRESS_COLUMNS = ['address_set__street', 'address_set__city', 'address_set__postcode',
+                   'address_set__state__name', 'address_set__country__name']
+
+# The serializer side is PlaceExpansionsMixin
+PLACE_EXPANSIONS = {
+    'visitors': Expansion(prefetch=[recent_visitors]),
+    'tags': Expansion(prefetch=[tags_prefetch]),
+    'transit': Expansion(prefetch=['transit']),
+    'address': Expansion(select=ADDRESS_RELATIONS, columns=ADDRESS_COLUMNS),
+    'address.country': Expansion(
+        select=ADDRESS_RELATIONS, columns=ADDRESS_COLUMNS + ['address_set__country__code']),
+}
+
+
+class ExpandPlan:
+    """
+    The select_related paths, prefetches and columns of a set of
+    expansions, with `prefix` leading to the expanded model.
+    """
+
+    def __init__(self, expansions, prefix=''):
+        self.select, self.prefetch, self.columns = [], [], []
+        for expansion in expansions:
+            self.select += [prefix + path for path in expansion.select]
+            self.prefetch += [lookup(prefix) if callable(lookup) else prefix + lookup
+                              for lookup in expansion.prefetch]
+            self.columns += [prefix + column for column in expansion.columns]
+
+    def apply(self, queryset):
+        loading, deferred = queryset.query.deferred_loading
+        if self.columns and not deferred:
+            queryset = queryset.only(*loading, *self.columns)
+        if self.select:
+            queryset = queryset.select_related(*dict.fromkeys(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        return queryset
+
+
+class ExpandMixin:
+    """
+    `?expand=` for the `expand_actions` of a viewset: validates the names
+    against `expansions` and plans what they load. Serializers see the
+    names as `expand` in their context.
+    """
+    expansions = {}
+    expand_actions = ('list', 'retrieve')
+
+    def get_expand_names(self):
+        if not hasattr(self, '_expand_names'):
+            self._expand_names = expand_names(self.request, list(self.expansions)) \
+                if self.action in self.expand_actions else []
+        return self._expand_names
+
+    def expand_queryset(self, queryset, prefix=''):
+        expansions = [self.expansions[name] for name in self.get_expand_names()]
+        return ExpandPlan(expansions, prefix).apply(queryset)
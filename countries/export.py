@@ -0,0 +1,85 @@
+import csv
+import json
+from decimal import Decimal
+
+# Output column -> ORM lookup
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'lat': 'lat',
+    'lon': 'lon',
+    'rating': 'rating',
+    'visitor_count': 'visitor_count',
+    'slug': 'slug',
+    'street': 'address_set__street',
+    'city': 'address_set__city',
+    'postcode': 'address_set__postcode',
+    'state': 'address_set__state__name',
+    'country': 'address_set__country__name',
+    'country_code': 'address_set__country__code',
+}
+EXPORT_FORMATS = ['ndjson', 'csv']
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_rows(queryset, chunk_size=2000):
+    """
+    Yield one tuple per place in EXPORT_COLUMNS order. Rows are read in
+    primary key ranges rather than with one long cursor: MySQLdb buffers a
+    whole result set client side, so this is what keeps memory flat there.
+    """
+    queryset = queryset.values_list(*EXPORT_COLUMNS.values()).order_by('id')
+    last_id = None
+    while True:
+        chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _json_value(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _batched(lines, chunk_size):
+    # Join lines so the response is written in few, larger pieces
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= chunk_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def ndjson_lines(rows):
+    columns = list(EXPORT_COLUMNS)
+    for row in rows:
+        record = dict(zip(columns, map(_json_value, row)))
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # File-like object handing back what csv.writer writes to it
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_lines(queryset, output='ndjson', chunk_size=2000):
+    rows = export_rows(queryset, chunk_size)
+    lines = csv_lines(rows) if output == 'csv' else ndjson_lines(rows)
+    return _batched(lines, chunk_size)
@@ -1,11 +1,145 @@
-from django_filters.rest_framework import FilterSet
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from django_filters.rest_framework import CharFilter, FilterSet, NumberFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from countries import geo, search
+from countries.cache import response_cache
 from countries.models import Place
+from tags.index import TagIndex, to_ids
+from tags.models import TaggedPlace
+
+place_tags = TagIndex(Place, cache_alias=response_cache.alias)
+# Larger tag matches are filtered with subqueries instead of an id list
+MAX_TAG_MATCHES = 10000
+
+
+def parse_floats(value, count, name):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise ValidationError({name: f'Expected {count} comma separated numbers.'})
+    return numbers
+
+
+def distance_km(lat, lon):
+    # Haversine distance from (lat, lon) to each row, evaluated by the DB
+    lat, lon = Radians(lat), Radians(lon)
+    row_lat = Radians('lat', output_field=FloatField())
+    row_lon = Radians('lon', output_field=FloatField())
+    a = (Power(Sin((row_lat - lat) / 2), 2)
+         + Cos(lat) * Cos(row_lat) * Power(Sin((row_lon - lon) / 2), 2))
+    return 2 * geo.EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def parse_labels(value):
+    return [label.strip() for label in (value or '').split(',') if label.strip()]
+
+
+def tagged_with(labels):
+    # Subquery of place ids tagged with any of `labels`
+    query = Q(pk__in=[])
+    for label in labels:
+        query |= Q(tag__label__iexact=label)
+    return TaggedPlace.objects \
+        .filter(content_type=ContentType.objects.get_for_model(Place)) \
+        .filter(query) \
+        .values('object_id')
+
+
+def geohash_cover(boxes):
+    # Prefix lookups on the indexed geohash column for every covering cell
+    query = Q()
+    for box in boxes:
+        prefixes = geo.cover(*box)
+        if not prefixes:
+            return Q()
+        for prefix in prefixes:
+            query |= Q(geohash__startswith=prefix)
+    return query
 
 
 class PlaceFilter(FilterSet):
+    near = CharFilter(method='filter_near', label='lat,lon')
+    radius_km = NumberFilter(method='filter_radius', label='Radius (km)')
+    bbox = CharFilter(method='filter_bbox',
+                      label='min_lon,min_lat,max_lon,max_lat')
+    tags_all = CharFilter(method='filter_tags', label='Tagged with all of')
+    tags_any = CharFilter(method='filter_tags', label='Tagged with any of')
+    tags_none = CharFilter(method='filter_tags', label='Tagged with none of')
+
     class Meta:
         model = Place
         fields = {
             'address_set__state': ['exact'],
             'rating': ['lt', 'gt']
         }
+
+    def filter_near(self, queryset, name, value):
+        lat, lon = parse_floats(value, 2, name)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValidationError({name: 'Coordinates out of range.'})
+        radius = self.form.cleaned_data.get('radius_km')
+        queryset = queryset.annotate(distance=distance_km(lat, lon))
+        if radius is not None:
+            radius = float(radius)
+            queryset = queryset \
+                .filter(geohash_cover(geo.bounding_box(lat, lon, radius))) \
+                .filter(distance__lte=radius)
+        return queryset.order_by('distance', 'id')
+
+    def filter_radius(self, queryset, name, value):
+        # Applied together with `near`
+        if value is not None and value <= 0:
+            raise ValidationError({name: 'Radius must be positive.'})
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        # The three tag parameters are combined in a single pass
+        if getattr(self, '_tags_filtered', False):
+            return queryset
+        self._tags_filtered = True
+        all_labels = parse_labels(self.form.cleaned_data.get('tags_all'))
+        any_labels = parse_labels(self.form.cleaned_data.get('tags_any'))
+        none_labels = parse_labels(self.form.cleaned_data.get('tags_none'))
+
+        include, exclude = place_tags.query(all_labels, any_labels, none_labels)
+        if include is not None:
+            if include.bit_count() <= MAX_TAG_MATCHES:
+                return queryset.filter(pk__in=to_ids(include))
+            for label in all_labels:
+                queryset = queryset.filter(pk__in=tagged_with([label]))
+            if any_labels:
+                queryset = queryset.filter(pk__in=tagged_with(any_labels))
+        elif exclude.bit_count() <= MAX_TAG_MATCHES:
+            return queryset.exclude(pk__in=to_ids(exclude))
+        if none_labels:
+            queryset = queryset.exclude(pk__in=tagged_with(none_labels))
+        return queryset
+
+    def filter_bbox(self, queryset, name, value):
+        min_lon, min_lat, max_lon, max_lat = parse_floats(value, 4, name)
+        if min_lat > max_lat:
+            raise ValidationError({name: 'min_lat must not exceed max_lat.'})
+        if min_lon > max_lon:
+            # Box crossing the antimeridian
+            max_lon += 360
+        boxes = geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon)
+        in_box = Q()
+        for box_min_lat, box_min_lon, box_max_lat, box_max_lon in boxes:
+            in_box |= Q(lat__range=(box_min_lat, box_max_lat),
+                        lon__range=(box_min_lon, box_max_lon))
+        return queryset.filter(geohash_cover(boxes)).filter(in_box)
+
+
+class PlaceSearchFilter(SearchFilter):
+    # Same `?search=` API as SearchFilter, answered from the inverted index
+    # in PlaceSearchTerm instead of LIKE scans over the text columns
+    def filter_queryset(self, request, queryset, view):
+        terms = search.tokenize(' '.join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+        return search.search(queryset, terms)
@@ -0,0 +1,106 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+GEOHASH_PRECISION = 9
+# Upper bound of geohash prefixes used to cover a search area. Keeps the
+# generated `geohash LIKE 'prefix%'` clauses small enough to stay index scans.
+MAX_COVER_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits = bits << 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    # Returns (lat_degrees, lon_degrees) covered by one cell
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Return the geohash prefixes of the finest grid that covers the box
+    with at most `max_cells` cells. An empty set means the box is too large
+    for the index to help and the caller should not filter on geohash.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        lat_cells = 180.0 / lat_step
+        lon_cells = 360.0 / lon_step
+        row_start = int((min_lat + 90) / lat_step)
+        row_end = min(int((max_lat + 90) / lat_step), int(lat_cells) - 1)
+        col_start = int((min_lon + 180) / lon_step)
+        col_end = min(int((max_lon + 180) / lon_step), int(lon_cells) - 1)
+        if (row_end - row_start + 1) * (col_end - col_start + 1) > max_cells:
+            continue
+        prefixes = set()
+        for row in range(row_start, row_end + 1):
+            for col in range(col_start, col_end + 1):
+                # Encode the centre of each cell to get its prefix
+                prefixes.add(encode(
+                    -90 + (row + 0.5) * lat_step,
+                    -180 + (col + 0.5) * lon_step,
+                    precision))
+        return prefixes
+    return set()
+
+
+def split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+    # Clamp to valid coordinates and split boxes crossing longitude 180
+    min_lat = max(min_lat, -90.0)
+    max_lat = min(max_lat, 90.0)
+    if max_lon - min_lon >= 360:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    if min_lon < -180:
+        return [(min_lat, min_lon + 360, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, min_lon, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon - 360)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def bounding_box(lat, lon, radius_km):
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat = lat - lat_delta
+    max_lat = lat + lat_delta
+    if min_lat <= -90 or max_lat >= 90:
+        # Circle reaches a pole, every longitude is in range
+        return split_antimeridian(min_lat, -180.0, max_lat, 180.0)
+    lon_delta = radius_km / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    return split_antimeridian(min_lat, lon - lon_delta, max_lat, lon + lon_delta)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
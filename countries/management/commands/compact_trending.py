@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from countries.trending import compact, rebuild_trends
+
+
+class Command(BaseCommand):
+    help = 'Drop decayed trending scores, or rebuild them from recent activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            scored = rebuild_trends(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Scored {scored} places'))
+        else:
+            dropped = compact()
+            self.stdout.write(self.style.SUCCESS(f'Dropped {dropped} decayed places'))
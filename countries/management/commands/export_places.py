@@ -0,0 +1,38 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from countries.export import EXPORT_FORMATS, export_lines
+from countries.filters import PlaceFilter
+from countries.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Export places with their address as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--file', help='Write to this path instead of stdout')
+        parser.add_argument('--filter', action='append', default=[],
+                            metavar='NAME=VALUE',
+                            help='PlaceFilter parameter, e.g. rating__gt=4')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        data = {}
+        for item in options['filter']:
+            name, _, value = item.partition('=')
+            data[name] = value
+        filterset = PlaceFilter(data, queryset=Place.objects.all())
+        try:
+            if not filterset.is_valid():
+                raise CommandError(filterset.errors.as_text())
+            queryset = filterset.qs
+        except ValidationError as error:
+            raise CommandError(error.detail)
+
+        lines = export_lines(queryset, options['output'], options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from countries.transit_index import link_places_to_transit
+
+
+class Command(BaseCommand):
+    help = 'Link every place to its nearest transit stops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=5,
+                            help='Number of stops to link per place')
+        parser.add_argument('--mode', default='',
+                            help='Comma separated transit modes, e.g. PB,CT')
+        parser.add_argument('--radius-km', type=float, default=None,
+                            help='Ignore stops further away than this')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true',
+                            help='Remove existing links first')
+
+    def handle(self, *args, **options):
+        modes = {mode for mode in options['mode'].split(',') if mode} or None
+        created = link_places_to_transit(
+            k=options['k'],
+            modes=modes,
+            radius_km=options['radius_km'],
+            batch_size=options['batch_size'],
+            replace=options['replace'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Linked {created} new place transit stops'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from countries.regions import resolve_regions
+
+
+class Command(BaseCommand):
+    help = 'Fill missing address states and countries from the nearest centroids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--max-km', type=float, default=None,
+                            help='Leave empty if the nearest centroid is further away')
+        parser.add_argument('--create', action='store_true',
+                            help='Also create addresses for places without one')
+
+    def handle(self, *args, **options):
+        resolved = resolve_regions(
+            batch_size=options['batch_size'],
+            max_km=options['max_km'],
+            create=options['create'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Resolved {resolved} place addresses'))
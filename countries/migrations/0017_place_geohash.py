@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from countries import geo
+
+
+def populate_geohash(apps, schema_editor):
+    Place = apps.get_model('countries', 'Place')
+    places = Place.objects.exclude(lat=None).exclude(lon=None)
+    for place in places.iterator(chunk_size=2000):
+        place.geohash = geo.encode(float(place.lat), float(place.lon))
+        place.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0016_alter_member_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=9),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+from countries.search import tokenize
+
+
+def populate_search_terms(apps, schema_editor):
+    Place = apps.get_model('countries', 'Place')
+    PlaceSearchTerm = apps.get_model('countries', 'PlaceSearchTerm')
+    batch = []
+    for place in Place.objects.only('name', 'description').iterator(chunk_size=1000):
+        counts = Counter(tokenize(f'{place.name or ""} {place.description or ""}'))
+        length = sum(counts.values())
+        batch.extend(
+            PlaceSearchTerm(term=term, place_id=place.id, tf=tf, doc_length=length)
+            for term, tf in counts.items())
+        if len(batch) >= 1000:
+            PlaceSearchTerm.objects.bulk_create(batch)
+            batch = []
+    PlaceSearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0017_place_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('tf', models.PositiveIntegerField()),
+                ('doc_length', models.PositiveIntegerField()),
+                ('place', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='countries.place')),
+            ],
+            options={
+                'unique_together': {('term', 'place')},
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
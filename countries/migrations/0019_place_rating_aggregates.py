@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:14
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Now
+
+RATING_BUCKETS = range(1, 6)
+
+
+def bucket_filter(star):
+    # Nearest whole star, halves round up (see countries.ratings)
+    query = Q()
+    if star > RATING_BUCKETS[0]:
+        query &= Q(rating__gte=Decimal(star) - Decimal('0.5'))
+    if star < RATING_BUCKETS[-1]:
+        query &= Q(rating__lt=Decimal(star) + Decimal('0.5'))
+    return query
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Place = apps.get_model('countries', 'Place')
+    Visitor = apps.get_model('countries', 'Visitor')
+    totals = Visitor.objects \
+        .order_by() \
+        .values('place_id') \
+        .annotate(count=Count('id'), total=Sum('rating'),
+                  **{f'count_{star}': Count('id', filter=bucket_filter(star))
+                     for star in RATING_BUCKETS})
+    # last_update too, it validates conditional GETs of the place
+    for row in totals.iterator(chunk_size=2000):
+        Place.objects.filter(pk=row['place_id']).update(
+            visitor_count=row['count'],
+            rating_sum=row['total'],
+            rating=(row['total'] / row['count']).quantize(Decimal('0.01')),
+            last_update=Now(),
+            **{f'rating_count_{star}': row[f'count_{star}'] for star in RATING_BUCKETS}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0018_placesearchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='visitor_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='visitor',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, max_digits=4, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
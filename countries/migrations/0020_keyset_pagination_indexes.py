@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0019_place_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['rating', 'id'], name='countries_p_rating_78c86b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['last_update', 'id'], name='countries_p_last_up_85b66c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tripplace',
+            index=models.Index(fields=['trip', 'date', 'id'], name='countries_t_trip_id_0d6c6d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['place', 'created_at', 'id'], name='countries_v_place_i_07b64a_idx'),
+        ),
+    ]
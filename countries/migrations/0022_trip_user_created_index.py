@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0021_trip_last_update'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='countries_t_user_id_679668_idx'),
+        ),
+    ]
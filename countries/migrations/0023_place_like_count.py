@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0022_trip_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0023_place_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceTrend',
+            fields=[
+                ('place', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='countries.place')),
+                ('log_score', models.FloatField()),
+                ('country', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='countries.country')),
+                ('state', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='countries.state')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['log_score', 'place'], name='countries_p_log_sco_6c7a70_idx'), models.Index(fields=['country', 'log_score', 'place'], name='countries_p_country_b24d9c_idx'), models.Index(fields=['state', 'log_score', 'place'], name='countries_p_state_i_a77ede_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+VISIT_TYPE_FIELDS = {'L': 'local', 'H': 'holiday', 'B': 'business', 'E': 'expert'}
+
+
+def populate_visit_type_aggregates(apps, schema_editor):
+    Place = apps.get_model('countries', 'Place')
+    Visitor = apps.get_model('countries', 'Visitor')
+    totals = Visitor.objects \
+        .order_by() \
+        .values_list('place_id', 'visit_type') \
+        .annotate(count=Count('id'), total=Sum('rating'))
+    for place_id, visit_type, count, total in totals.iterator(chunk_size=2000):
+        prefix = VISIT_TYPE_FIELDS.get(visit_type)
+        if prefix is not None:
+            Place.objects.filter(pk=place_id).update(**{
+                f'{prefix}_count': count,
+                f'{prefix}_rating_sum': total,
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0024_placetrend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='business_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='business_rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='expert_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='expert_rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='holiday_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='holiday_rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='local_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='local_rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(populate_visit_type_aggregates, migrations.RunPython.noop),
+    ]
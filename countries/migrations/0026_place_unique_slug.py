@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:44
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_unique_slugs(apps, schema_editor):
+    # Blank slugs and all but the oldest place of a repeated slug get
+    # `<name>-<id>`, which nothing else uses
+    Place = apps.get_model('countries', 'Place')
+    max_length = Place._meta.get_field('slug').max_length
+    taken = set()
+    changed = []
+    places = Place.objects.order_by('id').only('id', 'name', 'slug')
+    for place in places.iterator(chunk_size=2000):
+        if place.slug and place.slug not in taken:
+            taken.add(place.slug)
+            continue
+        changed.append(place)
+    for place in changed:
+        suffix = f'-{place.id}'
+        base = slugify(place.name)[:max_length - len(suffix)] or 'place'
+        slug, counter = base + suffix, 1
+        while slug in taken:
+            counter += 1
+            slug = f'{base[:max_length - len(suffix) - len(str(counter)) - 1]}-{counter}{suffix}'
+        taken.add(slug)
+        place.slug = slug
+    Place.objects.bulk_update(changed, ['slug'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries', '0025_place_visit_type_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_unique_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='place',
+            name='slug',
+            field=models.SlugField(blank=True, unique=True),
+        ),
+    ]
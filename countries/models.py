@@ -1,9 +1,12 @@
 from decimal import Decimal
 from django.contrib import admin
+from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import DecimalValidator, MinValueValidator, MaxValueValidator
 from django.db import models
 from django.conf import settings
+from django.utils.text import slugify
 from uuid import uuid4
+from . import geo
 
 # Create your models here.
 
@@ -30,19 +33,87 @@ class Place(models.Model):
         blank=True
     )
     status = models.CharField(max_length=1, choices=PLACE_STATUS, default='A')
+    # Review aggregates maintained from Visitor writes (see ratings.py)
+    visitor_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
+    # Per visit type, see Visitor.VISIT_TYPES
+    local_count = models.PositiveIntegerField(default=0, editable=False)
+    local_rating_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+    holiday_count = models.PositiveIntegerField(default=0, editable=False)
+    holiday_rating_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+    business_count = models.PositiveIntegerField(default=0, editable=False)
+    business_rating_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+    expert_count = models.PositiveIntegerField(default=0, editable=False)
+    expert_rating_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+    # Flushed in batches from likes.LikeCountDelta (see likes/counters.py)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
     transit = models.ManyToManyField('Transit')
+    # For prefetching, see tags.models.tags_prefetch
+    tagged_items = GenericRelation('tags.TaggedPlace')
     created_at = models.DateTimeField(auto_now_add=True)
     status_change_at = models.DateTimeField(auto_now=True)
     last_update = models.DateTimeField(auto_now=True)
-    # Search engine optimization
-    slug = models.SlugField(blank=True)
+    # Search engine optimization. Unique, so bulk upserts can match on it;
+    # left blank, save() derives one from the name
+    slug = models.SlugField(blank=True, unique=True)
+    # Spatial index: prefix searches on the geohash only touch nearby cells
+    geohash = models.CharField(
+        max_length=geo.GEOHASH_PRECISION,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
 
     # Show place name instead of default name on admin site
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = self.unique_slug()
+        if self.lat is not None and self.lon is not None:
+            self.geohash = geo.encode(float(self.lat), float(self.lon))
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and {'lat', 'lon'} & set(update_fields):
+                kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+    def unique_slug(self):
+        max_length = self._meta.get_field('slug').max_length
+        slug = slugify(self.name)[:max_length] or 'place'
+        if Place.objects.filter(slug=slug).exists():
+            slug = f'{slug[:max_length - 9]}-{uuid4().hex[:8]}'
+        return slug
+
     class Meta:
         ordering = ['name']
+        # Keyset pagination over the allowed orderings
+        indexes = [
+            models.Index(fields=['rating', 'id']),
+            models.Index(fields=['last_update', 'id']),
+        ]
+
+
+# Inverted index over place text used by the search filter
+class PlaceSearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    place = models.ForeignKey(
+        Place, on_delete=models.CASCADE, related_name='search_terms')
+    tf = models.PositiveIntegerField()
+    doc_length = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['term', 'place']]
 
 
 class Transit(models.Model):
@@ -96,7 +167,11 @@ class Visitor(models.Model):
                              blank=True,
                              null=True,
                              on_delete=models.SET_NULL)
-    rating = models.DecimalField(max_digits=4, decimal_places=2)
+    rating = models.DecimalField(
+        max_digits=4,
+        decimal_places=2,
+        validators=[MinValueValidator(1), MaxValueValidator(5)]
+    )
     review = models.TextField()
     visit_type = models.CharField(
         max_length=1, choices=VISIT_TYPES, default='H')
@@ -104,6 +179,11 @@ class Visitor(models.Model):
         Place, on_delete=models.CASCADE, related_name='visitor_set')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['place', 'created_at', 'id']),
+        ]
+
 
 class Country(models.Model):
     code = models.CharField(max_length=3)
@@ -154,9 +234,32 @@ class Address(models.Model):
         verbose_name_plural = "addresses"
 
 
+# Decayed activity score of a place, maintained by trending.py
+class PlaceTrend(models.Model):
+    place = models.OneToOneField(
+        Place, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    # log2 of the score scaled to trending.EPOCH: it only grows, yet ordering
+    # by it ranks places by their current, decayed score
+    log_score = models.FloatField()
+    # Copied from the address so filtered top-N reads stay on one index
+    country = models.ForeignKey(
+        Country, on_delete=models.SET_NULL, null=True, related_name='+')
+    state = models.ForeignKey(
+        State, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['log_score', 'place']),
+            models.Index(fields=['country', 'log_score', 'place']),
+            models.Index(fields=['state', 'log_score', 'place']),
+        ]
+
+
 class Trip(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped whenever one of its trip places changes
+    last_update = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(Member,
                              blank=True,
                              null=True,
@@ -166,6 +269,9 @@ class Trip(models.Model):
         permissions = [
             ('duplicate_trip', 'Can duplicate trip')
         ]
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
 
 
 class TripPlace(models.Model):
@@ -183,3 +289,6 @@ class TripPlace(models.Model):
     # Only allow one place in each trip
     class Meta:
         unique_together = [['trip', 'place', 'date']]
+        indexes = [
+            models.Index(fields=['trip', 'date', 'id']),
+        ]
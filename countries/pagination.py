@@ -0,0 +1,167 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination over whatever ordering the view and its filters put on
+    the queryset, always tie-broken on the primary key. The cursor carries
+    the ordering values of the last row seen, so every page is a
+    `WHERE (...) > (...) ORDER BY ... LIMIT n` range scan with no COUNT(*)
+    and no OFFSET.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('pk',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page([obj async for obj in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        # The rows of the requested page plus one to tell if there are more
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_keyset_ordering(queryset)
+        self.fields = [self.get_output_field(queryset, name)
+                       for name, _ in self.ordering]
+        self.position, self.reverse = self.decode_keyset_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [(name, not descending) for name, descending in ordering]
+        queryset = queryset.order_by(*[
+            self.order_by(name, descending, field)
+            for (name, descending), field in zip(ordering, self.fields)])
+        if self.position is not None:
+            queryset = queryset.filter(self.after(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_keyset_ordering(self, queryset):
+        # Ordering as (field, descending) pairs, ending with the primary key
+        order_by = queryset.query.order_by
+        if not order_by and queryset.query.default_ordering:
+            order_by = queryset.model._meta.ordering
+        ordering = []
+        for item in order_by or self.ordering:
+            if isinstance(item, OrderBy) and isinstance(item.expression, F):
+                ordering.append((item.expression.name, item.descending))
+            elif isinstance(item, str) and item != '?':
+                ordering.append((item.lstrip('-'), item.startswith('-')))
+            else:
+                raise self.ordering_error(item)
+        pk_name = queryset.model._meta.pk.name
+        ordering = [(pk_name if name == 'pk' else name, descending)
+                    for name, descending in ordering]
+        # Only local columns and annotations have a value to put in cursors
+        columns = {name for field in queryset.model._meta.concrete_fields
+                   for name in (field.name, field.attname)}
+        for name, _ in ordering:
+            if name not in columns and name not in queryset.query.annotations:
+                raise self.ordering_error(name)
+        if pk_name not in [name for name, _ in ordering]:
+            ordering.append((pk_name, False))
+        return ordering
+
+    def order_by(self, name, descending, field):
+        if not field.null:
+            return F(name).desc() if descending else F(name).asc()
+        if descending:
+            return F(name).desc(nulls_last=True)
+        return F(name).asc(nulls_first=True)
+
+    def ordering_error(self, item):
+        # A 400 rather than a 500: the ordering may come from the query string
+        return ValidationError(
+            {'ordering': [f'Results cannot be paged in order of {item!r}.']})
+
+    def get_output_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def after(self, ordering, position):
+        # Rows strictly after `position` in `ordering`, nulls sort first
+        # ascending and last descending
+        query = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), field, value in zip(ordering, self.fields, position):
+            if value is None:
+                if not descending:
+                    query |= equal & Q(**{f'{name}__isnull': False})
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            lookup = 'lt' if descending else 'gt'
+            beyond = Q(**{f'{name}__{lookup}': value})
+            if descending and field.null:
+                beyond |= Q(**{f'{name}__isnull': True})
+            query |= equal & beyond
+            equal &= Q(**{name: value})
+        return query
+
+    def get_position(self, instance):
+        # Model instances or `.values()` rows
+        if isinstance(instance, dict):
+            return [instance[name] for name, _ in self.ordering]
+        return [getattr(instance, name) for name, _ in self.ordering]
+
+    def decode_keyset_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            token = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if token['o'] != [name for name, _ in self.ordering]:
+                raise ValueError('Cursor belongs to a different ordering')
+            position = [None if value is None else field.to_python(value)
+                        for field, value in zip(self.fields, token['p'], strict=True)]
+            return position, bool(token.get('r'))
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_keyset_cursor(self, instance, reverse):
+        position = [None if value is None else str(value)
+                    for value in self.get_position(instance)]
+        token = {'o': [name for name, _ in self.ordering], 'p': position}
+        if reverse:
+            token['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(token).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_keyset_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_keyset_cursor(self.page[0], reverse=True)
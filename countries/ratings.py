@@ -0,0 +1,170 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Now
+from django.utils import timezone
+from countries.cache import response_cache
+from countries.models import Place, Visitor
+from countries.updates import fast_bulk_update
+
+RATING_BUCKETS = range(1, 6)
+# Visit type -> prefix of its Place aggregate fields
+VISIT_TYPE_FIELDS = {code: label.lower() for code, label in Visitor.VISIT_TYPES}
+# Rating of a place without reviews
+NO_REVIEW_RATING = Place._meta.get_field('rating').default
+
+
+def rating_bucket(rating):
+    # Nearest whole star, halves round up
+    star = int(Decimal(rating).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    return min(max(star, RATING_BUCKETS[0]), RATING_BUCKETS[-1])
+
+
+def bucket_filter(star, field='rating'):
+    query = Q()
+    if star > RATING_BUCKETS[0]:
+        query &= Q(**{f'{field}__gte': Decimal(star) - Decimal('0.5')})
+    if star < RATING_BUCKETS[-1]:
+        query &= Q(**{f'{field}__lt': Decimal(star) + Decimal('0.5')})
+    return query
+
+
+def refresh_average(place_id):
+    # Separate statement: MySQL applies SET clauses left to right, so the new
+    # counters would be visible mid-update there but not on other backends
+    Place.objects.filter(pk=place_id).update(
+        rating=Case(
+            When(visitor_count=0, then=Value(NO_REVIEW_RATING)),
+            default=Cast('rating_sum', FloatField()) / F('visitor_count'),
+            output_field=FloatField()
+        ),
+        last_update=Now()
+    )
+
+
+def apply_rating_change(place_id, added=None, removed=None,
+                        added_type=None, removed_type=None):
+    """
+    Adjust the review aggregates of a place for one review being added,
+    removed, or changed from `removed` to `added`. The visit types of the
+    review before and after go in `removed_type` and `added_type`.
+    """
+    changes = {}
+
+    def adjust(field, delta):
+        changes[field] = changes.get(field, F(field)) + delta
+
+    count_delta = 0
+    sum_delta = Decimal(0)
+    if added is not None:
+        count_delta += 1
+        sum_delta += added
+        adjust(f'rating_count_{rating_bucket(added)}', 1)
+        if added_type in VISIT_TYPE_FIELDS:
+            adjust(f'{VISIT_TYPE_FIELDS[added_type]}_count', 1)
+            adjust(f'{VISIT_TYPE_FIELDS[added_type]}_rating_sum', added)
+    if removed is not None:
+        count_delta -= 1
+        sum_delta -= removed
+        adjust(f'rating_count_{rating_bucket(removed)}', -1)
+        if removed_type in VISIT_TYPE_FIELDS:
+            adjust(f'{VISIT_TYPE_FIELDS[removed_type]}_count', -1)
+            adjust(f'{VISIT_TYPE_FIELDS[removed_type]}_rating_sum', -removed)
+    if count_delta:
+        changes['visitor_count'] = F('visitor_count') + count_delta
+    if sum_delta:
+        changes['rating_sum'] = F('rating_sum') + sum_delta
+    if not changes:
+        return
+    changes['last_update'] = Now()
+    with transaction.atomic():
+        Place.objects.filter(pk=place_id).update(**changes)
+        refresh_average(place_id)
+        response_cache.invalidate()
+
+
+def review_stats(place_id):
+    """
+    Review count, mean, star histogram and visit type breakdown of a place,
+    read from its aggregates. None if there is no such place.
+    """
+    fields = ['visitor_count', 'rating_sum'] + \
+        [f'rating_count_{star}' for star in RATING_BUCKETS] + \
+        [f'{prefix}_{suffix}' for prefix in VISIT_TYPE_FIELDS.values()
+         for suffix in ('count', 'rating_sum')]
+    row = Place.objects.filter(pk=place_id).values(*fields).first()
+    if row is None:
+        return None
+
+    def mean(total, count):
+        return round(float(total) / count, 2) if count else None
+
+    return {
+        'count': row['visitor_count'],
+        'mean': mean(row['rating_sum'], row['visitor_count']),
+        'histogram': {
+            str(star): row[f'rating_count_{star}'] for star in RATING_BUCKETS},
+        'visit_types': {
+            code: {
+                'label': label,
+                'count': row[f'{VISIT_TYPE_FIELDS[code]}_count'],
+                'mean': mean(row[f'{VISIT_TYPE_FIELDS[code]}_rating_sum'],
+                             row[f'{VISIT_TYPE_FIELDS[code]}_count']),
+            }
+            for code, label in Visitor.VISIT_TYPES
+        },
+    }
+
+
+def rebuild_rating_aggregates(batch_size=1000):
+    """
+    Recompute the review aggregates of every place from Visitor rows.
+    Returns the number of places with reviews.
+    """
+    totals = Visitor.objects.order_by().values('place_id').annotate(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{f'count_{star}': Count('id', filter=bucket_filter(star))
+           for star in RATING_BUCKETS},
+        **{f'{prefix}_count': Count('id', filter=Q(visit_type=code))
+           for code, prefix in VISIT_TYPE_FIELDS.items()},
+        **{f'{prefix}_rating_sum': Sum('rating', filter=Q(visit_type=code))
+           for code, prefix in VISIT_TYPE_FIELDS.items()},
+    )
+    visit_type_fields = [f'{prefix}_{suffix}' for prefix in VISIT_TYPE_FIELDS.values()
+                         for suffix in ('count', 'rating_sum')]
+    fields = ['visitor_count', 'rating_sum', 'rating', 'last_update'] + \
+        [f'rating_count_{star}' for star in RATING_BUCKETS] + visit_type_fields
+    updated = 0
+    with transaction.atomic():
+        # last_update moves with the aggregates, it validates conditional GETs
+        now = timezone.now()
+        Place.objects.update(
+            visitor_count=0,
+            rating_sum=0,
+            rating=NO_REVIEW_RATING,
+            last_update=now,
+            **{f'rating_count_{star}': 0 for star in RATING_BUCKETS},
+            **{field: 0 for field in visit_type_fields}
+        )
+        batch = []
+        for row in totals.iterator(chunk_size=batch_size):
+            place = Place(
+                pk=row['place_id'],
+                visitor_count=row['count'],
+                rating_sum=row['total'],
+                rating=(row['total'] / row['count']).quantize(Decimal('0.01')),
+                last_update=now,
+                **{f'rating_count_{star}': row[f'count_{star}']
+                   for star in RATING_BUCKETS},
+                **{field: row[field] or 0 for field in visit_type_fields}
+            )
+            batch.append(place)
+            if len(batch) >= batch_size:
+                fast_bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        fast_bulk_update(batch, fields)
+        updated += len(batch)
+        response_cache.invalidate()
+    return updated
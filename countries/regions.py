@@ -0,0 +1,204 @@
+import threading
+import numpy as np
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from countries import geo
+from countries.cache import response_cache
+from countries.models import Address, Country, Place, PlaceTrend, State
+from countries.updates import fast_bulk_update
+
+
+class RegionIndex:
+    """
+    Nearest-centroid lookups for states and countries. Centroids are kept
+    as unit vectors, so the nearest one is the largest dot product; a block
+    of points is matched against a whole table in one NumPy step, which for
+    tables this size beats walking a tree point by point. Reloaded on next
+    use after either table changes, in every process: the tables carry a
+    version number in the `cache_alias` cache, as in TagIndex; that cache
+    has to be shared by all workers.
+    """
+    block_size = 1024
+    version_key = 'countries:region_index:version'
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._tables = None
+        self._version = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def shared_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 1, None)
+            version = self.cache.get(self.version_key, 1)
+        return version
+
+    def load(self):
+        version = self.shared_version()
+        tables = {}
+        for model in (State, Country):
+            rows = list(model.objects.values_list('id', 'lat', 'lon'))
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            lat = np.array([float(row[1]) for row in rows])
+            lon = np.array([float(row[2]) for row in rows])
+            tables[model] = (ids, unit_vectors(lat, lon))
+        self._tables, self._version = tables, version
+        return tables
+
+    def invalidate(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.add(self.version_key, 1, None)
+        self._tables = None
+
+    def tables(self):
+        tables, version = self._tables, self.shared_version()
+        if tables is None or self._version != version:
+            with self._lock:
+                tables = self._tables
+                if tables is None or self._version != version:
+                    tables = self.load()
+        return tables
+
+    def nearest_many(self, model, lat, lon, max_km=None):
+        """
+        Ids of the `model` rows with the nearest centroids to each point,
+        None where the table is empty or the centroid is beyond `max_km`.
+        """
+        ids, centroids = self.tables()[model]
+        if not len(ids):
+            return [None] * len(lat)
+        points = unit_vectors(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+        result = []
+        for start in range(0, len(points), self.block_size):
+            similarity = points[start:start + self.block_size] @ centroids.T
+            best = similarity.argmax(axis=1)
+            nearest = ids[best].tolist()
+            if max_km is not None:
+                cosine = np.clip(similarity[np.arange(len(best)), best], -1, 1)
+                too_far = geo.EARTH_RADIUS_KM * np.arccos(cosine) > max_km
+                nearest = [None if far else region_id
+                           for region_id, far in zip(nearest, too_far)]
+            result.extend(nearest)
+        return result
+
+    def nearest(self, model, lat, lon, max_km=None):
+        return self.nearest_many(model, [lat], [lon], max_km)[0]
+
+
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=1)
+
+
+region_index = RegionIndex(cache_alias=response_cache.alias)
+
+
+def fill_missing(address, lat, lon, max_km=None):
+    """
+    Set `state_id` / `country_id` of `address` from the nearest centroids
+    where they are empty. Returns True if anything was filled.
+    """
+    return bool(fill_missing_many([(address, lat, lon)], max_km))
+
+
+def fill_missing_many(items, max_km=None):
+    """
+    `fill_missing` for many (address, lat, lon) at once. Returns the
+    addresses that changed.
+    """
+    items = [item for item in items if item[1] is not None and item[2] is not None]
+    changed = {}
+    for model, field in [(State, 'state_id'), (Country, 'country_id')]:
+        missing = [item for item in items if getattr(item[0], field) is None]
+        if not missing:
+            continue
+        nearest = region_index.nearest_many(
+            model,
+            [float(lat) for _, lat, _ in missing],
+            [float(lon) for _, _, lon in missing],
+            max_km)
+        for (address, _, _), region_id in zip(missing, nearest):
+            if region_id is not None:
+                setattr(address, field, region_id)
+                changed[id(address)] = address
+    return list(changed.values())
+
+
+def trends_of(addresses):
+    # Rows that do not exist are simply not matched by the update
+    return [PlaceTrend(place_id=address.place_id,
+                       state_id=address.state_id,
+                       country_id=address.country_id)
+            for address in addresses]
+
+
+def save_regions(addresses):
+    fast_bulk_update(addresses, ['state', 'country'], key='place')
+    fast_bulk_update(trends_of(addresses), ['state', 'country'])
+    Place.objects \
+        .filter(pk__in=[address.place_id for address in addresses]) \
+        .update(last_update=Now())
+
+
+def resolve_regions(batch_size=5000, max_km=None, create=False):
+    """
+    Fill missing address states and countries of every place, reading and
+    writing `batch_size` places at a time. With `create`, places without an
+    address get one. Returns the number of addresses filled.
+    """
+    region_index.load()
+    resolved = 0
+
+    missing = Address.objects \
+        .filter(Q(state=None) | Q(country=None)) \
+        .order_by('place_id') \
+        .values_list('place_id', 'state_id', 'country_id', 'place__lat', 'place__lon')
+    last_id = None
+    while True:
+        chunk = missing if last_id is None else missing.filter(place_id__gt=last_id)
+        rows = list(chunk[:batch_size])
+        filled = fill_missing_many(
+            [(Address(place_id=place_id, state_id=state_id, country_id=country_id), lat, lon)
+             for place_id, state_id, country_id, lat, lon in rows],
+            max_km)
+        with transaction.atomic():
+            save_regions(filled)
+        resolved += len(filled)
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1][0]
+
+    if create:
+        homeless = Place.objects \
+            .filter(address_set=None) \
+            .order_by('id') \
+            .values_list('id', 'lat', 'lon')
+        while True:
+            rows = list(homeless[:batch_size])
+            addresses = [Address(place_id=place_id) for place_id, _, _ in rows]
+            fill_missing_many(
+                [(address, lat, lon) for address, (_, lat, lon) in zip(addresses, rows)],
+                max_km)
+            with transaction.atomic():
+                Address.objects.bulk_create(addresses, batch_size=batch_size)
+                fast_bulk_update(trends_of(addresses), ['state', 'country'])
+                Place.objects \
+                    .filter(pk__in=[place_id for place_id, _, _ in rows]) \
+                    .update(last_update=Now())
+            resolved += len(addresses)
+            if len(rows) < batch_size:
+                break
+
+    if resolved:
+        response_cache.invalidate()
+    return resolved
@@ -0,0 +1,45 @@
+import re
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes a few floats differently from json: 1e-6 for 1e-06 and
+# 0.00001 for 1e-05. Both are looked for with cheap literal-led patterns;
+# strings can match as well, which only costs a fallback.
+EXPONENT = re.compile(rb'e[-0-9]')
+SMALL_DECIMAL = re.compile(rb'(?<![0-9])0\.0000')
+
+
+def differs_from_json(ret):
+    if b'0.0000' in ret and SMALL_DECIMAL.search(ret):
+        return True
+    for match in EXPONENT.finditer(ret):
+        if ret[match.start() - 1:match.start()].isdigit():
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes through orjson when it is
+    installed. Anything orjson would write differently goes through the
+    stdlib encoder instead: indented output, non-default JSON settings,
+    values orjson cannot encode and floats it formats differently.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates and times go through DRF's encoder for its formatting
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if differs_from_json(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,122 @@
+import time
+import numpy as np
+from countries import geo
+from countries.cache import LRUCache
+
+# Distance matrices by (trip id, version), see `trip_matrix`
+matrix_cache = LRUCache(max_bytes=64 * 1024 * 1024)
+MATRIX_TIMEOUT = 3600
+
+
+def haversine_matrix(lat, lon):
+    """
+    Pairwise great-circle distances (km) between points given as arrays of
+    degrees.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    half_dlat = (lat[:, None] - lat[None, :]) / 2
+    half_dlon = (lon[:, None] - lon[None, :]) / 2
+    a = np.sin(half_dlat) ** 2 \
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(half_dlon) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def trip_matrix(trip_id, version, lat, lon):
+    # Reused until the trip or one of its places changes `version`
+    key = (trip_id, version)
+    matrix = matrix_cache.get(key)
+    if matrix is None:
+        matrix = haversine_matrix(lat, lon)
+        matrix_cache.set(key, matrix, matrix.nbytes, MATRIX_TIMEOUT)
+    return matrix
+
+
+def path_length(matrix, route):
+    if len(route) < 2:
+        return 0.0
+    return float(matrix[route[:-1], route[1:]].sum())
+
+
+def nearest_neighbour(matrix):
+    # Open path starting at the first stop
+    size = len(matrix)
+    route = [0]
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = True
+    for _ in range(size - 1):
+        distances = np.where(visited, np.inf, matrix[route[-1]])
+        stop = int(np.argmin(distances))
+        route.append(stop)
+        visited[stop] = True
+    return np.array(route)
+
+
+def two_opt(matrix, route, deadline):
+    """
+    Improve an open path by reversing segments while that shortens it. The
+    first stop stays fixed. Each pass scores all segment ends for a given
+    start in one vectorised step.
+    """
+    size = len(route)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, size - 1):
+            before, first = route[i - 1], route[i]
+            ends = np.arange(i + 1, size)
+            last = route[ends]
+            has_next = ends < size - 1
+            after = route[np.minimum(ends + 1, size - 1)]
+            delta = matrix[before, last] - matrix[before, first] \
+                + np.where(has_next, matrix[first, after] - matrix[last, after], 0)
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = ends[best]
+                route[i:j + 1] = route[i:j + 1][::-1].copy()
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return route
+
+
+def optimize_day(matrix, deadline):
+    route = nearest_neighbour(matrix)
+    if len(route) > 3:
+        route = two_opt(matrix, route, deadline)
+    return route
+
+
+def optimize_trip(trip_id, version, stops, time_budget=2.0):
+    """
+    `stops` are (trip_place_id, place_id, date, lat, lon) tuples in their
+    current order. Returns the visiting order and travel distance per day.
+    """
+    deadline = time.monotonic() + time_budget
+    if not stops:
+        return {'total_distance_km': 0.0, 'days': []}
+    lat = np.array([float(stop[3]) for stop in stops])
+    lon = np.array([float(stop[4]) for stop in stops])
+    matrix = trip_matrix(trip_id, version, lat, lon)
+
+    days = {}
+    for index, stop in enumerate(stops):
+        days.setdefault(stop[2], []).append(index)
+
+    results = []
+    for date, indexes in days.items():
+        indexes = np.array(indexes)
+        day_matrix = matrix[np.ix_(indexes, indexes)]
+        route = optimize_day(day_matrix, deadline)
+        results.append({
+            'date': date,
+            'trip_places': [stops[indexes[stop]][0] for stop in route],
+            'places': [stops[indexes[stop]][1] for stop in route],
+            'distance_km': round(path_length(day_matrix, route), 3),
+            'original_distance_km': round(
+                path_length(day_matrix, np.arange(len(indexes))), 3),
+        })
+    return {
+        'total_distance_km': round(sum(day['distance_km'] for day in results), 3),
+        'days': results,
+    }
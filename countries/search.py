@@ -0,0 +1,117 @@
+import re
+from math import log
+from collections import Counter
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, FloatField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast
+from countries.cache import response_cache
+from countries.models import Place, PlaceSearchTerm
+
+INDEXED_FIELDS = ['name', 'description']
+MAX_TERM_LENGTH = 64
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STATS_CACHE_KEY = 'countries:search:stats'
+STATS_CACHE_TIMEOUT = 600
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in _WORD.findall(text.lower())]
+
+
+def place_terms(place):
+    text = ' '.join(getattr(place, field) or '' for field in INDEXED_FIELDS)
+    return Counter(tokenize(text))
+
+
+def build_terms(place):
+    counts = place_terms(place)
+    length = sum(counts.values())
+    return [PlaceSearchTerm(term=term, place_id=place.id, tf=tf, doc_length=length)
+            for term, tf in counts.items()]
+
+
+def index_place(place):
+    with transaction.atomic():
+        PlaceSearchTerm.objects.filter(place_id=place.id).delete()
+        PlaceSearchTerm.objects.bulk_create(build_terms(place))
+
+
+def rebuild_index(batch_size=1000):
+    places = Place.objects.order_by().only('id', *INDEXED_FIELDS)
+    indexed = 0
+    with transaction.atomic():
+        PlaceSearchTerm.objects.all().delete()
+        batch = []
+        for place in places.iterator(chunk_size=batch_size):
+            batch.extend(build_terms(place))
+            indexed += 1
+            if len(batch) >= batch_size:
+                PlaceSearchTerm.objects.bulk_create(batch)
+                batch = []
+        PlaceSearchTerm.objects.bulk_create(batch)
+        response_cache.invalidate()
+    cache.delete(STATS_CACHE_KEY)
+    return indexed
+
+
+def corpus_stats():
+    # Document count and average length only shift the ranking slightly, so
+    # they are cached rather than recomputed on every search
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        total_docs = Place.objects.count()
+        total_terms = PlaceSearchTerm.objects.aggregate(total=Sum('tf'))['total'] or 0
+        stats = (total_docs, total_terms / total_docs if total_docs else 0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def idf(term_count, total_docs):
+    return log(1 + (total_docs - term_count + 0.5) / (term_count + 0.5))
+
+
+def search(queryset, terms):
+    """
+    Restrict `queryset` to places matching every term (as a word prefix)
+    and order them by BM25 score.
+    """
+    total_docs, avg_length = corpus_stats()
+    avg_length = avg_length or 1
+    tf = Cast('tf', FloatField())
+    length = Cast('doc_length', FloatField())
+    tf_norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+    matches = {}
+    score = Value(0.0)
+    for index, term in enumerate(dict.fromkeys(terms)):
+        match = Q(term__startswith=term)
+        term_count = PlaceSearchTerm.objects.filter(match) \
+            .values('place_id').distinct().count()
+        score = score + Sum(Case(
+            When(match, then=Value(idf(term_count, total_docs)) * tf_norm),
+            default=Value(0.0),
+            output_field=FloatField()))
+        matches[f'match_{index}'] = Max(Case(
+            When(match, then=Value(1)), default=Value(0)))
+
+    any_term = Q()
+    for term in terms:
+        any_term |= Q(term__startswith=term)
+    postings = PlaceSearchTerm.objects.filter(any_term).values('place_id')
+    matching = postings.annotate(**matches) \
+        .filter(**{name: 1 for name in matches}) \
+        .values('place_id')
+    ranked = postings.filter(place_id=OuterRef('pk')) \
+        .annotate(score=score) \
+        .values('score')
+    return queryset \
+        .filter(pk__in=matching) \
+        .annotate(search_rank=Subquery(ranked, output_field=FloatField())) \
+        .order_by('-search_rank', 'id')
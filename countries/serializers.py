@@ -1,6 +1,12 @@
 from itertools import count
+from operator import itemgetter
+from django.db import models
 from rest_framework import serializers
-from .models import Member, Place, Address, TripPlace, Visitor, Trip
+from rest_framework.reverse import reverse
+from countries.sparse import SparseFieldsSerializerMixin, sparse_field_names
+from likes.models import LikedPlace
+from tags.models import Tag, TaggedPlace
+from .models import Country, Member, Place, Address, Transit, TripPlace, Visitor, Trip
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -28,7 +34,108 @@ class AddressSerializer(serializers.ModelSerializer):
         return instance
 
 
-class PlaceSerializer(serializers.ModelSerializer):
+class CountrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Country
+        fields = [
+            'id',
+            'code',
+            'name',
+        ]
+
+
+class ExpandedAddressSerializer(AddressSerializer):
+    country = CountrySerializer(read_only=True)
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = [
+            'id',
+            'label',
+        ]
+
+
+class TransitSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Transit
+        fields = [
+            'id',
+            'name',
+            'lat',
+            'long',
+            'mode',
+        ]
+
+
+class RecentVisitorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Visitor
+        fields = [
+            'id',
+            'created_at',
+            'review',
+            'rating',
+            'visit_type',
+        ]
+
+
+def place_tags(place: Place):
+    if hasattr(place, 'prefetched_tagged_items'):
+        return [tagged_item.tag for tagged_item in place.prefetched_tagged_items]
+    tagged_items = TaggedPlace.objects \
+        .get_tags_for(Place, place.id) \
+        .order_by('tag__label')
+    return [tagged_item.tag for tagged_item in tagged_items]
+
+
+class PlaceExpansionsMixin:
+    """
+    Place fields added or replaced by the `expand` names in the context,
+    see countries.expand. Expanded fields are shown whatever `?fields=`
+    and `?omit=` select.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get('expand', ())
+        if 'visitors' in expand:
+            fields['visitors'] = RecentVisitorSerializer(
+                source='recent_visitors', many=True, read_only=True)
+        if 'tags' in expand:
+            fields['tags'] = serializers.SerializerMethodField(method_name='get_tag_details')
+        if 'transit' in expand:
+            fields['transit'] = TransitSerializer(many=True, read_only=True)
+        if 'address.country' in expand:
+            fields['address'] = ExpandedAddressSerializer(source='address_set', read_only=True)
+        elif 'address' in expand:
+            fields['address'] = AddressSerializer(source='address_set', read_only=True)
+        return fields
+
+    def get_tag_details(self, place: Place):
+        return TagSerializer(place_tags(place), many=True).data
+
+
+class PlaceListSerializer(serializers.ListSerializer):
+    # Load the tags and likes of every place on the page in one query each,
+    # unless they are not requested or the caller (e.g. an async view)
+    # already did
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        places = list(iterable)
+        fields = self.child.fields
+        if 'tags' in fields and \
+                not all(hasattr(place, 'prefetched_tagged_items') for place in places):
+            places = TaggedPlace.objects.prefetch_tags(places)
+        request = self.context.get('request')
+        if request is not None and 'is_liked' in fields and \
+                not all(hasattr(place, 'prefetched_is_liked') for place in places):
+            places = LikedPlace.objects.prefetch_liked(places, request.user)
+        return super().to_representation(places)
+
+
+class PlaceSerializer(PlaceExpansionsMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
     # Like defining field in model. Not all field in model return in API
     # DOC: django-rest-framework.org/api-guide/fields
     address = AddressSerializer(
@@ -39,14 +146,9 @@ class PlaceSerializer(serializers.ModelSerializer):
         view_name='place-detail',
         read_only=True
     )
-
-    # visitors = serializers.HyperlinkedRelatedField(
-    #     view_name='place-visitors-list',
-    #     source='visitor_set',
-    #     lookup_field='place',
-    #     lookup_url_kwarg='place_pk',
-    #     read_only=True
-    # )
+    tags = serializers.SerializerMethodField(method_name='get_tag_labels')
+    is_liked = serializers.SerializerMethodField()
+    # Reviews, transit and tag details are opt-in, see PlaceExpansionsMixin
 
     class Meta:
         model = Place
@@ -57,11 +159,29 @@ class PlaceSerializer(serializers.ModelSerializer):
             'lat',
             'lon',
             'rating',
+            'visitor_count',
+            'like_count',
+            'is_liked',
             'slug',
             'place_link',
             'address',
-            # 'visitors',
+            'tags',
         ]
+        # Maintained from reviews, see ratings.py
+        read_only_fields = ['rating']
+        list_serializer_class = PlaceListSerializer
+
+    def get_tag_labels(self, place: Place):
+        return [tag.label for tag in place_tags(place)]
+
+    def get_is_liked(self, place: Place):
+        if hasattr(place, 'prefetched_is_liked'):
+            return place.prefetched_is_liked
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        return place.id in LikedPlace.objects.get_liked_ids(
+            request.user, Place, [place.id])
 
     # Override create method
     def create(self, validated_data):
@@ -73,11 +193,158 @@ class PlaceSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         for key, value in validated_data.items():
             setattr(instance, key, value)
-        instance.save()
+        # Only the submitted columns, the aggregates on `instance` may be stale
+        instance.save(update_fields=[
+            *validated_data, 'status_change_at', 'last_update'])
         return instance
 
 
-class VisitorSerializer(serializers.ModelSerializer):
+class FastPlaceListSerializer:
+    """
+    Same output as PlaceSerializer(many=True), built from `.values()` rows
+    instead of model instances walked field by field. The accessor of each
+    field is resolved once per request, and `place_link` is filled into a
+    URL reversed once per request.
+    """
+    # Output field -> ORM lookup, in PlaceSerializer.Meta.fields order.
+    # None marks the declared fields put together in `get_accessors`.
+    fields = {
+        name: None if name in PlaceSerializer._declared_fields else name
+        for name in PlaceSerializer.Meta.fields
+    }
+    # In AddressSerializer.Meta.fields order; `state` and `country` are
+    # their names, as StringRelatedField renders them
+    address_fields = {
+        'street': 'address_set__street',
+        'city': 'address_set__city',
+        'postcode': 'address_set__postcode',
+        'state': 'address_set__state__name',
+        'state_id': 'address_set__state_id',
+        'country': 'address_set__country__name',
+        'country_id': 'address_set__country_id',
+    }
+    # None when the place has no address
+    address_key = 'address_set__place'
+    url_marker = '__pk__'
+
+    def __init__(self, context):
+        self.context = context
+        names = sparse_field_names(context.get('request'), list(self.fields))
+        if names is not None:
+            self.fields = {name: self.fields[name] for name in names}
+
+    def get_queryset(self, queryset, extra=()):
+        # `extra`: further values the caller needs, e.g. ordering for cursors
+        lookups = ['id', *[lookup for lookup in self.fields.values() if lookup is not None]]
+        if 'address' in self.fields:
+            lookups += [*self.address_fields.values(), self.address_key]
+        return queryset.values(*dict.fromkeys([*lookups, *extra]))
+
+    def get_url_template(self):
+        url = reverse('place-detail', kwargs={'pk': self.url_marker},
+                      request=self.context['request'], format=self.context.get('format'))
+        prefix, suffix = url.split(self.url_marker)
+        return prefix, suffix
+
+    def get_accessors(self, tags, liked):
+        prefix, suffix = self.get_url_template() if 'place_link' in self.fields else ('', '')
+        address_fields = list(self.address_fields.items())
+        address_key = self.address_key
+
+        def get_address(row):
+            if row[address_key] is None:
+                return None
+            return {name: row[lookup] for name, lookup in address_fields}
+
+        computed = {
+            'is_liked': lambda row: row['id'] in liked,
+            'place_link': lambda row: f'{prefix}{row["id"]}{suffix}',
+            'address': get_address,
+            'tags': lambda row: tags.get(row['id'], []),
+        }
+        accessors = []
+        for name, lookup in self.fields.items():
+            if lookup is None:
+                accessors.append((name, computed[name]))
+            elif isinstance(Place._meta.get_field(lookup), models.DecimalField):
+                # What the JSON encoder makes of DecimalField output
+                accessors.append((name, lambda row, lookup=lookup:
+                                  None if row[lookup] is None else float(row[lookup])))
+            else:
+                accessors.append((name, itemgetter(lookup)))
+        return accessors
+
+    def to_representation(self, rows, tags, liked):
+        accessors = self.get_accessors(tags, liked)
+        return [{name: get(row) for name, get in accessors} for row in rows]
+
+    def get_user(self):
+        request = self.context.get('request')
+        return getattr(request, 'user', None)
+
+    def data(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        ids = [row['id'] for row in rows]
+        tags, liked = {}, set()
+        if 'tags' in self.fields:
+            tags = TaggedPlace.objects.get_tags_for_many(Place, ids)
+        user = self.get_user()
+        if 'is_liked' in self.fields and user is not None and user.is_authenticated:
+            liked = LikedPlace.objects.get_liked_ids(user, Place, ids)
+        return self.to_representation(rows, labels(tags), liked)
+
+    async def adata(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        ids = [row['id'] for row in rows]
+        tags, liked = {}, set()
+        if 'tags' in self.fields:
+            tags = await TaggedPlace.objects.aget_tags_for_many(Place, ids)
+        user = self.get_user()
+        if 'is_liked' in self.fields and user is not None and user.is_authenticated:
+            liked = await LikedPlace.objects.aget_liked_ids(user, Place, ids)
+        return self.to_representation(rows, labels(tags), liked)
+
+
+def labels(tags):
+    return {object_id: [tag.label for tag in object_tags]
+            for object_id, object_tags in tags.items()}
+
+
+class TrendingPlaceSerializer(PlaceSerializer):
+    trending_score = serializers.FloatField(read_only=True)
+
+    class Meta(PlaceSerializer.Meta):
+        fields = PlaceSerializer.Meta.fields + ['trending_score']
+
+
+class BulkPlaceSerializer(PlaceSerializer):
+    address = AddressSerializer(source='address_set', required=False)
+
+    class Meta(PlaceSerializer.Meta):
+        # Existing slugs are updated, see bulk.upsert_places
+        extra_kwargs = {'slug': {'validators': []}}
+
+
+class NearestTransitSerializer(serializers.ModelSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Transit
+        fields = [
+            'id',
+            'name',
+            'lat',
+            'long',
+            'mode',
+            'distance_km',
+        ]
+
+
+class VisitorSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
 
     place = serializers.HyperlinkedRelatedField(
         view_name='place-detail',
@@ -101,7 +368,7 @@ class VisitorSerializer(serializers.ModelSerializer):
         return Visitor.objects.create(place_id=place_id, **validated_data)
 
 
-class TripPlaceDetailSerializer(serializers.ModelSerializer):
+class TripPlaceDetailSerializer(PlaceExpansionsMixin, serializers.ModelSerializer):
     class Meta:
         model = Place
         fields = [
@@ -146,7 +413,8 @@ class CreateOrUpdateTripPlaceSerializer(serializers.ModelSerializer):
         return value
 
     def validate_date(self, value):
-        if TripPlace.objects.filter(
+        # New trip places on an existing date update that entry, see save()
+        if self.instance is not None and TripPlace.objects.filter(
             place_id=self.instance.place_id,
             date=value
         ).exists():
@@ -157,7 +425,7 @@ class CreateOrUpdateTripPlaceSerializer(serializers.ModelSerializer):
         return value
 
     def save(self, **kwargs):
-        trip_place_id = self.instance.id
+        trip_place_id = self.instance.id if self.instance is not None else None
         trip_id = self.context['trip_id']
         place_id = self.validated_data['place_id']
         duration = self.validated_data['duration']
@@ -187,21 +455,44 @@ class CreateOrUpdateTripPlaceSerializer(serializers.ModelSerializer):
         return self.instance
 
 
-class TripSerializer(serializers.ModelSerializer):
+def untagged_places(trips):
+    # Places embedded in `trips` whose tags are not loaded yet
+    return [trip_place.place
+            for trip in trips
+            for trip_place in trip.trip_places.all()
+            if not hasattr(trip_place.place, 'prefetched_tagged_items')]
+
+
+class TripListSerializer(serializers.ListSerializer):
+    # Load the tags of ?expand=tags for the places of every trip on the
+    # page in one query
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        trips = list(iterable)
+        if 'tags' in self.context.get('expand', ()) and 'places' in self.child.fields:
+            TaggedPlace.objects.prefetch_tags(untagged_places(trips))
+        return super().to_representation(trips)
+
+
+class TripSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     places = TripPlaceSerializer(
         source='trip_places',
         many=True,
         read_only=True
     )
-    total_places = serializers.IntegerField(
-        source='trip_places.count',
+    # Totals are annotated by TripViewSet.get_queryset, the methods only
+    # fall back to the trip places for instances that were not loaded there
+    total_places = serializers.SerializerMethodField(
+        method_name='count_places',
         read_only=True
     )
     total_duration = serializers.SerializerMethodField(
         method_name='calculate_total_duration',
         read_only=True
     )
+    start_date = serializers.SerializerMethodField(read_only=True)
+    end_date = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Trip
@@ -210,11 +501,49 @@ class TripSerializer(serializers.ModelSerializer):
             'places',
             'total_places',
             'total_duration',
+            'start_date',
+            'end_date',
             'created_at'
         ]
+        list_serializer_class = TripListSerializer
+
+    def to_representation(self, trip: Trip):
+        # A no-op under TripListSerializer, which loaded them already
+        if 'tags' in self.context.get('expand', ()) and 'places' in self.fields:
+            TaggedPlace.objects.prefetch_tags(untagged_places([trip]))
+        return super().to_representation(trip)
+
+    def count_places(self, trip: Trip):
+        if hasattr(trip, 'total_places'):
+            return trip.total_places
+        return len(trip.trip_places.all())
 
     def calculate_total_duration(self, trip: Trip):
-        return sum([place.duration for place in trip.trip_places.all()])
+        if hasattr(trip, 'total_duration'):
+            return trip.total_duration
+        return sum([place.duration or 0 for place in trip.trip_places.all()])
+
+    def get_start_date(self, trip: Trip):
+        if hasattr(trip, 'start_date'):
+            return trip.start_date
+        return min(filter(None, [place.date for place in trip.trip_places.all()]), default=None)
+
+    def get_end_date(self, trip: Trip):
+        if hasattr(trip, 'end_date'):
+            return trip.end_date
+        return max(filter(None, [place.date for place in trip.trip_places.all()]), default=None)
+
+
+class TripSummarySerializer(TripSerializer):
+    class Meta(TripSerializer.Meta):
+        fields = [
+            'id',
+            'total_places',
+            'total_duration',
+            'start_date',
+            'end_date',
+            'created_at'
+        ]
 
 
 class MemberSerializer(serializers.ModelSerializer):
@@ -0,0 +1,181 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from countries import search, trending
+from countries.cache import response_cache
+from countries.regions import fill_missing, region_index, save_regions
+from countries.models import Address, Country, Place, PlaceTrend, State, Transit, Trip, TripPlace, Visitor
+from likes.signals import likes_flushed
+from tags.models import TaggedPlace
+from countries.transit_index import transit_index
+
+
+@receiver(post_save, sender=Transit)
+def update_transit_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: transit_index.update(instance))
+
+
+@receiver(post_delete, sender=Transit)
+def remove_from_transit_index(sender, instance, **kwargs):
+    transit_id = instance.id
+    transaction.on_commit(lambda: transit_index.remove(transit_id))
+
+
+@receiver(post_save, sender=Place)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_place(instance)
+
+
+# Regions are filled in for new addresses and places that moved; a region
+# cleared on an existing address stays cleared
+
+
+@receiver(pre_save, sender=Address)
+def fill_address_regions(sender, instance, raw=False, **kwargs):
+    if raw or not instance._state.adding or \
+            (instance.state_id is not None and instance.country_id is not None):
+        return
+    location = Place.objects \
+        .filter(pk=instance.place_id) \
+        .values_list('lat', 'lon') \
+        .first()
+    if location is not None:
+        fill_missing(instance, *location)
+
+
+@receiver(pre_save, sender=Place)
+def remember_previous_location(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._moved = False
+    if raw or instance._state.adding or \
+            (update_fields is not None and not {'lat', 'lon'} & set(update_fields)):
+        return
+    previous = Place.objects \
+        .filter(pk=instance.pk) \
+        .values_list('lat', 'lon') \
+        .first()
+    instance._moved = previous is not None and previous != (instance.lat, instance.lon)
+
+
+@receiver(post_save, sender=Place)
+def fill_moved_place_regions(sender, instance, **kwargs):
+    if not getattr(instance, '_moved', False):
+        return
+    address = Address.objects \
+        .filter(Q(state=None) | Q(country=None), place_id=instance.pk) \
+        .first()
+    if address is not None and fill_missing(address, instance.lat, instance.lon):
+        save_regions([address])
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_region_index(sender, **kwargs):
+    transaction.on_commit(region_index.invalidate)
+
+
+# Keep Place.last_update and Trip.last_update covering everything their API
+# representation embeds, so conditional GET validators stay truthful
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def touch_address_place(sender, instance, **kwargs):
+    Place.objects.filter(pk=instance.place_id).update(last_update=Now())
+
+
+@receiver(post_save, sender=State)
+def touch_state_places(sender, instance, created, **kwargs):
+    if not created:
+        Place.objects.filter(address_set__state=instance).update(last_update=Now())
+
+
+@receiver(post_save, sender=Country)
+def touch_country_places(sender, instance, created, **kwargs):
+    if not created:
+        Place.objects.filter(address_set__country=instance).update(last_update=Now())
+
+
+# Embedded by ?expand=transit
+
+
+@receiver(m2m_changed, sender=Place.transit.through)
+def touch_transit_places(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        places = Place.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        places = Place.objects.filter(transit=instance)
+    else:
+        places = Place.objects.filter(pk__in=pk_set)
+    places.update(last_update=Now())
+    response_cache.invalidate()
+
+
+@receiver(post_save, sender=Transit)
+@receiver(pre_delete, sender=Transit)
+def touch_transit_stop_places(sender, instance, created=False, **kwargs):
+    if not created:
+        Place.objects.filter(transit=instance).update(last_update=Now())
+        response_cache.invalidate()
+
+
+@receiver(post_save, sender=TripPlace)
+@receiver(post_delete, sender=TripPlace)
+def touch_trip(sender, instance, **kwargs):
+    Trip.objects.filter(pk=instance.trip_id).update(last_update=Now())
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_place_responses(sender, **kwargs):
+    response_cache.invalidate()
+
+
+@receiver(post_save, sender=TaggedPlace)
+@receiver(post_delete, sender=TaggedPlace)
+def touch_tagged_place(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Place).id:
+        Place.objects.filter(pk=instance.object_id).update(last_update=Now())
+        response_cache.invalidate()
+
+
+# Trending scores
+
+
+@receiver(post_save, sender=Visitor)
+def record_visit(sender, instance, created, **kwargs):
+    if created:
+        trending.record_event('visit', instance.place_id, instance.created_at)
+
+
+@receiver(post_save, sender=TripPlace)
+def record_trip_place(sender, instance, created, **kwargs):
+    if created:
+        trending.record_event('trip', instance.place_id, instance.created_at)
+
+
+@receiver(likes_flushed, sender=Place)
+def record_likes(sender, added, **kwargs):
+    for place_id, count in added.items():
+        trending.record(place_id, trending.EVENT_WEIGHTS['like'] * count)
+
+
+@receiver(post_save, sender=Address)
+def move_place_trend(sender, instance, **kwargs):
+    PlaceTrend.objects \
+        .filter(place_id=instance.place_id) \
+        .update(country_id=instance.country_id, state_id=instance.state_id)
@@ -0,0 +1,110 @@
+from django.db.models import F
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def sparse_field_names(request, available):
+    """
+    The names in `available` selected by `?fields=` and `?omit=` on a read
+    request, in their original order; None when neither is given.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = request.query_params
+    fields = parse_names(params.get(FIELDS_PARAM))
+    omit = parse_names(params.get(OMIT_PARAM))
+    if not fields and not omit:
+        return None
+    errors = {}
+    for param, names in [(FIELDS_PARAM, fields), (OMIT_PARAM, omit)]:
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            errors[param] = f'Unknown fields: {", ".join(unknown)}.'
+    if errors:
+        raise ValidationError(errors)
+    keep = set(fields or available) - set(omit)
+    return [name for name in available if name in keep]
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Serialize only the fields selected by `?fields=` / `?omit=` of the
+    request in the context. Writes always see every field.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = sparse_field_names(self.context.get('request'), list(fields))
+        if names is None:
+            return fields
+        return {name: fields[name] for name in names}
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=` / `?omit=` for a GenericAPIView whose serializer uses
+    SparseFieldsSerializerMixin: the filtered queryset then loads only the
+    columns the remaining fields read, and only their joins. Viewsets
+    check `wants()` for prefetches and annotations of their own.
+    """
+    # Serializer field -> ORM lookups it reads through related models,
+    # joined with select_related. Fields backed by a column of the model
+    # itself (foreign keys included) need no entry.
+    sparse_field_lookups = {}
+
+    def get_sparse_fields(self):
+        # Serializer fields of this request by name, None when all are
+        if not hasattr(self, '_sparse_fields'):
+            fields = self.get_serializer_class()().fields
+            names = sparse_field_names(self.request, list(fields))
+            self._sparse_fields = None if names is None \
+                else {name: fields[name] for name in names}
+        return self._sparse_fields
+
+    def wants(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def filter_queryset(self, queryset):
+        return self.narrow_queryset(super().filter_queryset(queryset))
+
+    def narrow_queryset(self, queryset):
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        meta = queryset.model._meta
+        local = {field.name for field in meta.concrete_fields}
+        # Ordering values are read back for pagination cursors
+        columns = [meta.pk.name, *[name for name in ordering_names(queryset) if name in local]]
+        lookups = []
+        for name, field in fields.items():
+            if name in self.sparse_field_lookups:
+                lookups += self.sparse_field_lookups[name]
+            elif field.source in local:
+                columns.append(field.source)
+        queryset = queryset.select_related(None)
+        relations = {lookup.rsplit('__', 1)[0] for lookup in lookups}
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*dict.fromkeys(columns + lookups))
+
+
+def ordering_names(queryset):
+    order_by = queryset.query.order_by
+    if not order_by and queryset.query.default_ordering:
+        order_by = queryset.model._meta.ordering
+    names = []
+    for item in order_by:
+        if isinstance(item, OrderBy) and isinstance(item.expression, F):
+            names.append(item.expression.name)
+        elif isinstance(item, str):
+            names.append(item.lstrip('-'))
+    return names
@@ -1,3 +1,536 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import ListAPIView
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.viewsets import GenericViewSet
+from countries import geo, search
+from countries.bulk import conflict_options, upsert_places
+from countries.cache import response_cache
+from countries.conditional import ConditionalRetrieveMixin
+from countries.filters import place_tags
+from countries.models import Address, Country, Place, State, Transit, Visitor
+from countries.pagination import KeysetPagination
+from countries.ratings import rebuild_rating_aggregates
+from countries.regions import RegionIndex, region_index
+from countries.serializers import BulkPlaceSerializer, PlaceSerializer
+from countries.transit_index import TransitIndex, link_places_to_transit, transit_index
+from tags.models import Tag, TaggedPlace
+
+
+def create_place(**kwargs):
+    return Place.objects.create(**{
+        'name': 'Harbour', 'lat': Decimal('1.28'), 'lon': Decimal('103.85'),
+        'slug': 'harbour', **kwargs})
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.place = create_place()
+        self.url = f'/countries/places/{self.place.id}/visitors/'
+
+    def review(self, rating, visit_type='H'):
+        response = self.client.post(self.url, {
+            'review': 'Nice', 'rating': rating, 'visit_type': visit_type})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def assertAggregates(self, count, rating, **fields):
+        place = Place.objects.get(pk=self.place.id)
+        self.assertEqual(place.visitor_count, count)
+        self.assertEqual(place.rating, Decimal(rating))
+        for field, value in fields.items():
+            self.assertEqual(getattr(place, field), value, field)
+
+    def test_add(self):
+        self.review(4, 'L')
+        self.review(3)
+        self.assertAggregates(2, '3.50', rating_sum=Decimal(7), rating_count_4=1,
+                              rating_count_3=1, local_count=1, holiday_count=1)
+
+    def test_update(self):
+        visitor_id = self.review(2)
+        response = self.client.patch(f'{self.url}{visitor_id}/',
+                                     {'rating': 5, 'visit_type': 'B'})
+        self.assertEqual(response.status_code, 200)
+        self.assertAggregates(1, '5.00', rating_count_2=0, rating_count_5=1,
+                              holiday_count=0, business_count=1)
+
+    def test_delete(self):
+        self.review(2)
+        visitor_id = self.review(4)
+        self.client.delete(f'{self.url}{visitor_id}/')
+        self.assertAggregates(1, '2.00', rating_count_4=0, rating_count_2=1)
+
+    def test_delete_last_review_resets_rating(self):
+        visitor_id = self.review(2)
+        self.client.delete(f'{self.url}{visitor_id}/')
+        self.assertAggregates(0, '5.00', rating_sum=Decimal(0), rating_count_2=0)
+
+    def test_rebuild(self):
+        self.review(3)
+        Visitor.objects.all().delete()
+        other = create_place(slug='other')
+        Visitor.objects.create(place=other, rating=Decimal(2), review='Meh')
+        self.assertEqual(rebuild_rating_aggregates(), 1)
+        self.assertAggregates(0, '5.00', rating_count_3=0, holiday_count=0)
+        other.refresh_from_db()
+        self.assertEqual((other.visitor_count, other.rating), (1, Decimal('2.00')))
+
+    def test_rebuild_changes_etag(self):
+        url = f'/countries/places/{self.place.id}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            Place.objects.filter(pk=self.place.id).update(
+                last_update=timezone.now() - timedelta(minutes=1))
+        etag = self.client.get(url)['ETag']
+        Visitor.objects.create(place=self.place, rating=Decimal(1), review='Meh')
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_rating_aggregates()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rating'], response.data['visitor_count']), (1, 1))
+
+    def test_place_update_keeps_aggregates(self):
+        stale = Place.objects.get(pk=self.place.id)
+        self.review(2)
+        serializer = PlaceSerializer(stale, data={'name': 'Old harbour'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertAggregates(1, '2.00', name='Old harbour', rating_count_2=1)
+
+    def test_rating_is_read_only(self):
+        admin = get_user_model().objects.create_user(
+            username='admin', email='admin@example.com', password='secret',
+            is_staff=True)
+        self.review(2)
+        self.client.force_authenticate(admin)
+        response = self.client.put(f'/countries/places/{self.place.id}/', {
+            'name': 'Harbour', 'lat': '1.28', 'lon': '103.85',
+            'slug': 'harbour', 'rating': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertAggregates(1, '2.00')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place = create_place()
+
+    def test_retrieve_only_viewset_has_no_list(self):
+        class Retrieve(ConditionalRetrieveMixin, GenericViewSet):
+            queryset = Place.objects.all()
+
+        self.assertFalse(hasattr(Retrieve, 'list'))
+
+    def test_trip_list_needs_authentication(self):
+        self.assertEqual(self.client.get('/countries/trips/').status_code, 401)
+
+    def test_not_modified(self):
+        url = f'/countries/places/{self.place.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_place_change_changes_etag(self):
+        url = f'/countries/places/{self.place.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.name = 'Old harbour'
+            self.place.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ResponseCacheKeyTests(TestCase):
+    def key(self, path, **extra):
+        request = Request(APIRequestFactory().get(path, **extra))
+        request.accepted_renderer = JSONRenderer()
+        return response_cache.key(request, 1)
+
+    def test_query_order_does_not_matter(self):
+        self.assertEqual(self.key('/countries/places/?a=1&b=2'),
+                         self.key('/countries/places/?b=2&a=1'))
+
+    def test_host_and_scheme_are_part_of_the_key(self):
+        with self.settings(ALLOWED_HOSTS=['testserver', 'example.com']):
+            key = self.key('/countries/places/')
+            self.assertNotEqual(key, self.key('/countries/places/', HTTP_HOST='example.com'))
+            self.assertNotEqual(key, self.key('/countries/places/', secure=True))
+
+    def test_cached_links_use_the_request_host(self):
+        client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_place()
+        with self.settings(ALLOWED_HOSTS=['testserver', 'example.com']):
+            client.get('/countries/places/')
+            response = client.get('/countries/places/', HTTP_HOST='example.com')
+        self.assertTrue(response.data['results'][0]['place_link']
+                        .startswith('http://example.com/'))
+
+
+class AddressRegionTests(TestCase):
+    def setUp(self):
+        self.country = Country.objects.create(code='SG', name='Singapore', lat=1.35, lon=103.82)
+        self.state = State.objects.create(name='Central', lat=1.29, lon=103.85)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place = create_place()
+
+    def tearDown(self):
+        # The rows are rolled back without committing, so no signal reloads it
+        region_index.invalidate()
+
+    def test_new_address_is_filled(self):
+        address = Address.objects.create(place=self.place)
+        self.assertEqual((address.state_id, address.country_id),
+                         (self.state.id, self.country.id))
+
+    def test_cleared_region_stays_cleared(self):
+        address = Address.objects.create(place=self.place)
+        address.state = None
+        address.save()
+        address.refresh_from_db()
+        self.assertIsNone(address.state_id)
+
+    def test_moved_place_is_filled(self):
+        address = Address.objects.create(place=self.place)
+        Address.objects.filter(pk=address.pk).update(state=None)
+        self.place.lat = Decimal('1.30')
+        self.place.save()
+        address.refresh_from_db()
+        self.assertEqual(address.state_id, self.state.id)
+
+    def test_index_reloads_after_other_process_changes(self):
+        # Processes share only the version in the cache, never LocMem
+        self.assertNotIsInstance(region_index.cache, LocMemCache)
+        other = RegionIndex(cache_alias=region_index.cache_alias)
+        self.assertEqual(other.nearest(State, 1.3, 103.8), self.state.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            north = State.objects.create(name='North', lat=1.44, lon=103.8)
+        self.assertEqual(other.nearest(State, 1.44, 103.8), north.id)
+
+
+class TransitIndexTests(TestCase):
+    def setUp(self):
+        Transit.objects.create(name='Raffles Place', lat=1.284, long=103.851, mode='CT')
+
+    def tearDown(self):
+        # The rows are rolled back without committing, so no signal reloads it
+        transit_index.bump(applied_locally=False)
+
+    def test_index_reloads_after_other_process_changes(self):
+        self.assertNotIsInstance(transit_index.cache, LocMemCache)
+        other = TransitIndex(cache_alias=transit_index.cache_alias)
+        self.assertEqual(len(other.nearest(1.28, 103.85, k=5)), 1)
+        # Saved here, applied to transit_index; `other` only sees the version
+        with self.captureOnCommitCallbacks(execute=True):
+            stop = Transit.objects.create(name='Marina Bay', lat=1.276, long=103.854, mode='CT')
+        self.assertIn(stop.id, [transit_id for _, transit_id in other.nearest(1.28, 103.85, k=5)])
+        with self.captureOnCommitCallbacks(execute=True):
+            stop.delete()
+        self.assertNotIn(stop.id, [transit_id for _, transit_id in other.nearest(1.28, 103.85, k=5)])
+
+
+    def test_link_places_touches_linked_places(self):
+        transit_index.bump(applied_locally=False)
+        earlier = timezone.now() - timedelta(minutes=1)
+        place = create_place()
+        Place.objects.filter(pk=place.pk).update(last_update=earlier)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(link_places_to_transit(k=1), 1)
+        place.refresh_from_db()
+        self.assertGreater(place.last_update, earlier)
+        self.assertEqual(place.transit.count(), 1)
+        # Existing links are not counted again
+        self.assertEqual(link_places_to_transit(k=1), 0)
+
+
+class FastListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_place()
+        create_place(name='Bay', slug='bay', description=None)
+        Address.objects.create(place=create_place(name='Quay', slug='quay'), city='Singapore')
+
+    def get(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.invalidate()
+        return self.client.get(url)
+
+    def test_same_output(self):
+        for url in ['/countries/places/', '/countries/places/?fields=id,address,tags']:
+            slow = self.get(url)
+            with self.settings(PLACE_FAST_LIST=True):
+                fast = self.get(url)
+            self.assertEqual(fast.content, slow.content, url)
+            self.assertEqual(fast.json(), slow.json())
+
+
+class PlaceIdSerializer(ModelSerializer):
+    class Meta:
+        model = Place
+        fields = ['id']
+
+
+class OrderedPlaceList(ListAPIView):
+    queryset = Place.objects.all()
+    serializer_class = PlaceIdSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['id', 'address_set__city']
+
+
+class KeysetOrderingTests(TestCase):
+    view = staticmethod(OrderedPlaceList.as_view())
+
+    def test_unsupported_ordering_is_a_bad_request(self):
+        create_place()
+        response = self.view(APIRequestFactory().get('/', {'ordering': 'address_set__city'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+    def test_random_ordering_is_a_bad_request(self):
+        paginator = KeysetPagination()
+        with self.assertRaises(ValidationError):
+            paginator.get_keyset_ordering(Place.objects.order_by('?'))
+
+    def test_supported_ordering(self):
+        create_place()
+        response = self.view(APIRequestFactory().get('/', {'ordering': '-id'}))
+        self.assertEqual(response.status_code, 200)
+
+
+class PlaceSlugTests(TestCase):
+    def test_blank_slug_is_filled(self):
+        first = create_place(slug='')
+        second = create_place(slug='')
+        self.assertEqual(first.slug, 'harbour')
+        self.assertTrue(second.slug.startswith('harbour-'))
+
+    def test_slug_is_unique(self):
+        create_place()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            create_place()
+
+    def test_upsert_matches_on_slug(self):
+        place = create_place()
+        results = upsert_places(BulkPlaceSerializer(), [
+            {'slug': 'harbour', 'name': 'Old harbour'},
+            {'name': 'New Bay', 'lat': '1.27', 'lon': '103.86'}])
+        self.assertEqual([result['status'] for result in results], ['updated', 'created'])
+        self.assertEqual(results[0]['id'], place.id)
+        self.assertEqual(Place.objects.get(slug='new-bay').id, results[1]['id'])
+
+    def test_slug_inserted_after_the_lookup(self):
+        def insert_first(rows):
+            # Another request creates the slug between lookup and insert
+            create_place(slug='harbour', description='Theirs')
+            return conflict_options(rows)
+
+        with mock.patch('countries.bulk.conflict_options', insert_first):
+            results = upsert_places(BulkPlaceSerializer(), [
+                {'slug': 'harbour', 'name': 'Old harbour', 'lat': '1.30', 'lon': '103.80'},
+                {'slug': 'bay', 'name': 'Bay', 'lat': '1.27', 'lon': '103.86'}])
+        place = Place.objects.get(slug='harbour')
+        self.assertEqual(results[0], {'status': 'updated', 'id': place.id, 'slug': 'harbour'})
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertEqual((place.name, place.description), ('Old harbour', 'Theirs'))
+        terms = set(place.search_terms.values_list('term', flat=True))
+        self.assertIn('old', terms)
+        self.assertIn('theirs', terms)
+
+    def test_insert_of_a_taken_slug_updates(self):
+        place = create_place(description='Kept')
+        row = {'slug': 'harbour', 'name': 'Old harbour',
+               'lat': Decimal('1.30'), 'lon': Decimal('103.80')}
+        Place.objects.bulk_create([Place(**row)], **conflict_options([row]))
+        place.refresh_from_db()
+        self.assertEqual((place.name, place.lat, place.description),
+                         ('Old harbour', Decimal('1.30'), 'Kept'))
+        self.assertEqual(Place.objects.count(), 1)
+
+
+class GeoFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Grids around Singapore, around Oslo, where a degree of longitude
+        # is half as long, and across the antimeridian
+        coords = [(0.93 + row * 0.08, 103.43 + col * 0.08)
+                  for row in range(8) for col in range(8)]
+        coords += [(59.71 + row * 0.09, 10.13 + col * 0.19)
+                   for row in range(6) for col in range(6)]
+        coords += [(-0.47 + row * 0.21, (179.37 + col * 0.17 + 180) % 360 - 180)
+                   for row in range(6) for col in range(6)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, (lat, lon) in enumerate(coords):
+                create_place(slug=f'place-{index}', lat=Decimal(f'{lat:.6f}'),
+                             lon=Decimal(f'{lon:.6f}'))
+
+    def ids(self, query):
+        response = self.client.get(f'/countries/places/?fields=id&page_size=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['next'])
+        return [row['id'] for row in response.data['results']]
+
+    def brute_force(self, test):
+        return [place.id for place in Place.objects.order_by('id')
+                if test(float(place.lat), float(place.lon))]
+
+    def test_radius_matches_haversine(self):
+        for lat, lon, radius in [(1.2345, 103.6789, 15), (1.2345, 103.6789, 40),
+                                 (59.9321, 10.6543, 25), (0.1234, 179.9567, 30),
+                                 (0.1234, -179.9567, 55)]:
+            distances = {place.id: geo.haversine_km(lat, lon, float(place.lat), float(place.lon))
+                         for place in Place.objects.all()}
+            expected = sorted((place_id for place_id, distance in distances.items()
+                               if distance <= radius), key=lambda place_id: distances[place_id])
+            self.assertTrue(expected)
+            self.assertEqual(self.ids(f'near={lat},{lon}&radius_km={radius}'), expected)
+
+    def test_bbox_matches_coordinates(self):
+        self.assertEqual(self.ids('bbox=103.555,1.005,103.905,1.405'), self.brute_force(
+            lambda lat, lon: 1.005 <= lat <= 1.405 and 103.555 <= lon <= 103.905))
+        # Crossing the antimeridian
+        expected = self.brute_force(
+            lambda lat, lon: -0.305 <= lat <= 0.605 and (lon >= 179.605 or lon <= -179.705))
+        self.assertTrue(expected)
+        self.assertEqual(self.ids('bbox=179.605,-0.305,-179.705,0.605'), expected)
+
+
+class SearchRankingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.delete(search.STATS_CACHE_KEY)
+        places = [
+            ('Lake', 'A lake by the lake'),
+            ('Lake view', 'Mountain lake with a long trail around the water'),
+            ('Lakeside park', None),
+            ('Mountain hut', 'Quiet mountain hut above the lakes'),
+            ('Hill', 'No water here'),
+            ('Mountain lake', 'Lake'),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, (name, description) in enumerate(places):
+                create_place(slug=f'place-{index}', name=name, description=description)
+
+    def ids(self, text):
+        response = self.client.get('/countries/places/',
+                                   {'search': text, 'fields': 'id', 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def bm25(self, terms):
+        # Every word starting with a term scores, as in search.search
+        documents = {place.id: search.place_terms(place) for place in Place.objects.all()}
+        avg_length = sum(sum(counts.values()) for counts in documents.values()) / len(documents)
+        scores = {}
+        for place_id, counts in documents.items():
+            length = sum(counts.values())
+            score = 0
+            for term in terms:
+                matching = [word for word in counts if word.startswith(term)]
+                if not matching:
+                    break
+                term_count = sum(any(word.startswith(term) for word in other)
+                                 for other in documents.values())
+                for word in matching:
+                    tf = counts[word]
+                    score += search.idf(term_count, len(documents)) * tf * (search.K1 + 1) / (
+                        tf + search.K1 * (1 - search.B + search.B * length / avg_length))
+            else:
+                scores[place_id] = score
+        return sorted(scores, key=lambda place_id: (-scores[place_id], place_id))
+
+    def test_order_matches_bm25(self):
+        for text in ['lake', 'mountain lake', 'lak', 'water']:
+            expected = self.bm25(search.tokenize(text))
+            self.assertTrue(expected)
+            self.assertEqual(self.ids(text), expected, text)
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.ids('hill lake'), [])
+        self.assertEqual(self.ids('nothing'), [])
+
+
+class TagFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        place_tags.invalidate()
+        tags = {label: Tag.objects.create(label=label) for label in ['Beach', 'Food', 'Museum']}
+        # Labels are matched case-insensitively, so both count as 'beach'
+        tags['beach'] = Tag.objects.create(label='beach')
+        tagged = ['', 'Beach', 'beach', 'Food', 'Beach Food', 'beach Museum',
+                  'Food Museum', 'Beach Food Museum', 'Museum']
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, labels in enumerate(tagged):
+                place = create_place(slug=f'place-{index}')
+                for label in labels.split():
+                    TaggedPlace.objects.create(tag=tags[label], content_object=place)
+
+    def tearDown(self):
+        place_tags.invalidate()
+
+    def ids(self, query):
+        response = self.client.get(f'/countries/places/?fields=id&page_size=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def orm(self, all_labels=(), any_labels=(), none_labels=()):
+        places = Place.objects.all()
+        for label in all_labels:
+            places = places.filter(pk__in=Place.objects.filter(
+                tagged_items__tag__label__iexact=label))
+        if any_labels:
+            tagged_any = Q()
+            for label in any_labels:
+                tagged_any |= Q(tagged_items__tag__label__iexact=label)
+            places = places.filter(pk__in=Place.objects.filter(tagged_any))
+        for label in none_labels:
+            places = places.exclude(pk__in=Place.objects.filter(
+                tagged_items__tag__label__iexact=label))
+        return list(places.order_by('id').values_list('id', flat=True))
+
+    def check_queries(self):
+        for all_labels, any_labels, none_labels in [
+                (['beach'], [], []), (['Beach', 'food'], [], []), ([], ['Food', 'museum'], []),
+                ([], [], ['beach']), ([], [], ['Beach', 'Museum']), (['Food'], ['Beach', 'Museum'], []),
+                (['museum'], [], ['Food']), ([], ['beach'], ['museum']), (['Unknown'], [], []),
+                ([], [], ['Unknown']), (['Beach'], ['Food', 'Unknown'], ['Museum'])]:
+            query = '&'.join(f'{name}={",".join(labels)}' for name, labels in [
+                ('tags_all', all_labels), ('tags_any', any_labels), ('tags_none', none_labels)]
+                if labels)
+            self.assertEqual(self.ids(query), self.orm(all_labels, any_labels, none_labels), query)
+
+    def test_bitmaps_match_the_orm(self):
+        self.check_queries()
+
+    def test_subqueries_match_the_orm(self):
+        # Past MAX_TAG_MATCHES the filter falls back to TaggedPlace subqueries
+        with mock.patch('countries.filters.MAX_TAG_MATCHES', 0):
+            self.check_queries()
+
+    def test_index_follows_tag_changes(self):
+        place = Place.objects.get(slug='place-0')
+        self.assertNotIn(place.id, self.ids('tags_all=food'))
+        with self.captureOnCommitCallbacks(execute=True):
+            TaggedPlace.objects.create(tag=Tag.objects.get(label='Food'), content_object=place)
+        self.assertIn(place.id, self.ids('tags_all=food'))
+        with self.captureOnCommitCallbacks(execute=True):
+            place.tagged_items.all().delete()
+        self.assertNotIn(place.id, self.ids('tags_all=food'))
 
-# Create your tests here.
@@ -0,0 +1,248 @@
+import math
+import threading
+from heapq import heappush, heapreplace
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.functions import Now
+from countries import geo
+from countries.cache import response_cache
+from countries.models import Place, Transit
+
+
+def to_xyz(lat, lon):
+    # Points on the unit sphere: straight-line distance grows with the
+    # great-circle distance and there is no seam at the antimeridian
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(squared_chord):
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class KDTree:
+    """
+    Static 3-d tree stored as a flat list: the node of a slice is its middle
+    element, the left and right halves are its subtrees.
+    """
+
+    def __init__(self, points):
+        # points: (x, y, z, transit_id)
+        self.points = list(points)
+        self._build(0, len(self.points), 0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, lo, hi, depth):
+        if hi - lo <= 1:
+            return
+        axis = depth % 3
+        self.points[lo:hi] = sorted(self.points[lo:hi], key=lambda p: p[axis])
+        mid = (lo + hi) // 2
+        self._build(lo, mid, depth + 1)
+        self._build(mid + 1, hi, depth + 1)
+
+    def nearest(self, target, k, heap, skip):
+        # heap keeps the k best as (-squared_distance, transit_id)
+        self._search(0, len(self.points), 0, target, k, heap, skip)
+
+    def _search(self, lo, hi, depth, target, k, heap, skip):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        point = self.points[mid]
+        if point[3] not in skip:
+            distance = ((point[0] - target[0]) ** 2
+                        + (point[1] - target[1]) ** 2
+                        + (point[2] - target[2]) ** 2)
+            if len(heap) < k:
+                heappush(heap, (-distance, point[3]))
+            elif distance < -heap[0][0]:
+                heapreplace(heap, (-distance, point[3]))
+        axis = depth % 3
+        diff = target[axis] - point[axis]
+        if diff < 0:
+            near, far = (lo, mid), (mid + 1, hi)
+        else:
+            near, far = (mid + 1, hi), (lo, mid)
+        self._search(near[0], near[1], depth + 1, target, k, heap, skip)
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._search(far[0], far[1], depth + 1, target, k, heap, skip)
+
+
+class TransitIndex:
+    """
+    Nearest-neighbour index over all Transit stops, one KD-tree per mode.
+    Changes are buffered (new points in `_pending`, stale tree entries in
+    `_removed`) and folded into fresh trees once the buffer gets large.
+
+    Local stop writes are applied in place. A version number in the
+    `cache_alias` cache tells other processes to reload, as in TagIndex;
+    that cache has to be shared by all workers.
+    """
+
+    version_key = 'countries:transit_index:version'
+
+    def __init__(self, rebuild_threshold=1024, cache_alias='default'):
+        self.rebuild_threshold = rebuild_threshold
+        self.cache_alias = cache_alias
+        self._lock = threading.RLock()
+        self._trees = None
+        self._pending = {}
+        self._removed = set()
+        self._version = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def shared_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 1, None)
+            version = self.cache.get(self.version_key, 1)
+        return version
+
+    def load(self):
+        version = self.shared_version()
+        rows = Transit.objects.values_list('id', 'lat', 'long', 'mode')
+        by_mode = {}
+        for transit_id, lat, lon, mode in rows.iterator(chunk_size=5000):
+            by_mode.setdefault(mode, []).append(
+                (*to_xyz(float(lat), float(lon)), transit_id))
+        trees = {mode: KDTree(points) for mode, points in by_mode.items()}
+        with self._lock:
+            self._trees = trees
+            self._pending = {}
+            self._removed = set()
+            self._version = version
+
+    def ensure_current(self):
+        if self._trees is None or self._version != self.shared_version():
+            with self._lock:
+                if self._trees is None or self._version != self.shared_version():
+                    self.load()
+
+    def bump(self, applied_locally):
+        # Keep the local copy if nobody else changed stops in the meantime
+        try:
+            version = self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.add(self.version_key, 1, None)
+            version = None
+        with self._lock:
+            if applied_locally and version is not None and version == (self._version or 0) + 1:
+                self._version = version
+            else:
+                self._trees = None
+
+    def update(self, transit):
+        with self._lock:
+            applied = self._trees is not None
+            if applied:
+                self._removed.add(transit.id)
+                self._pending[transit.id] = (
+                    transit.mode,
+                    (*to_xyz(float(transit.lat), float(transit.long)), transit.id))
+                self._maybe_rebuild()
+        self.bump(applied_locally=applied)
+
+    def remove(self, transit_id):
+        with self._lock:
+            applied = self._trees is not None
+            if applied:
+                self._removed.add(transit_id)
+                self._pending.pop(transit_id, None)
+                self._maybe_rebuild()
+        self.bump(applied_locally=applied)
+
+    def _maybe_rebuild(self):
+        if len(self._pending) + len(self._removed) < self.rebuild_threshold:
+            return
+        by_mode = {}
+        for mode, tree in self._trees.items():
+            by_mode[mode] = [
+                point for point in tree.points if point[3] not in self._removed]
+        for mode, point in self._pending.values():
+            by_mode.setdefault(mode, []).append(point)
+        self._trees = {
+            mode: KDTree(points) for mode, points in by_mode.items() if points}
+        self._pending = {}
+        self._removed = set()
+
+    def nearest(self, lat, lon, k=5, modes=None):
+        """
+        Return up to `k` (distance_km, transit_id) pairs ordered by distance.
+        """
+        self.ensure_current()
+        with self._lock:
+            if self._trees is None:
+                # Another process changed stops since ensure_current
+                self.load()
+            trees, pending, removed = self._trees, self._pending, self._removed
+            target = to_xyz(lat, lon)
+            heap = []
+            for mode, tree in trees.items():
+                if modes is None or mode in modes:
+                    tree.nearest(target, k, heap, removed)
+            for mode, point in pending.values():
+                if modes is not None and mode not in modes:
+                    continue
+                distance = ((point[0] - target[0]) ** 2
+                            + (point[1] - target[1]) ** 2
+                            + (point[2] - target[2]) ** 2)
+                if len(heap) < k:
+                    heappush(heap, (-distance, point[3]))
+                elif distance < -heap[0][0]:
+                    heapreplace(heap, (-distance, point[3]))
+        return [(chord_to_km(-distance), transit_id)
+                for distance, transit_id in sorted(heap, reverse=True)]
+
+
+transit_index = TransitIndex(cache_alias=response_cache.alias)
+
+
+def link_places_to_transit(k=5, modes=None, radius_km=None,
+                           batch_size=1000, replace=False):
+    """
+    Fill the Place.transit relation with the `k` nearest stops of every
+    place, writing the join rows in batches. Returns the number of links
+    inserted; links that already existed are not counted.
+    """
+    through = Place.transit.through
+    places = Place.objects.order_by().values_list('id', 'lat', 'lon')
+    batch = []
+
+    def write(batch):
+        through.objects.bulk_create(batch, ignore_conflicts=True)
+        # The place API embeds transit, see countries.signals
+        Place.objects \
+            .filter(pk__in={link.place_id for link in batch}) \
+            .update(last_update=Now())
+
+    with transaction.atomic():
+        if replace:
+            Place.objects \
+                .filter(pk__in=through.objects.values('place_id')) \
+                .update(last_update=Now())
+            through.objects.all().delete()
+        before = through.objects.count()
+        for place_id, lat, lon in places.iterator(chunk_size=batch_size):
+            if lat is None or lon is None:
+                continue
+            for distance, transit_id in transit_index.nearest(
+                    float(lat), float(lon), k, modes):
+                if radius_km is not None and distance > radius_km:
+                    break
+                batch.append(through(place_id=place_id, transit_id=transit_id))
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+        created = through.objects.count() - before
+        if created or replace:
+            response_cache.invalidate()
+    return created
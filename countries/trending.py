@@ -0,0 +1,147 @@
+import math
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone as django_timezone
+from countries.models import Address, PlaceTrend, TripPlace, Visitor
+
+# Scores are stored as log2(sum of weight * 2 ** ((time - EPOCH) / HALF_LIFE)).
+# Scaling every event to a fixed epoch means older events never need to be
+# rewritten to decay: all scores shrink by the same factor as time passes,
+# so the stored values still rank places by their decayed score.
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE', timedelta(days=2))
+EVENT_WEIGHTS = {
+    'visit': 3.0,
+    'trip': 2.0,
+    'like': 1.0,
+}
+# Places whose decayed score falls below this are dropped by `compact`
+MIN_SCORE = 0.01
+
+
+def now():
+    return django_timezone.now()
+
+
+def log_weight(weight, at):
+    return math.log2(weight) + (at - EPOCH) / HALF_LIFE
+
+
+def log_threshold(score, at=None):
+    return log_weight(score, at or now())
+
+
+def current_score(log_score, at=None):
+    return 2 ** (log_score - log_weight(1, at or now()))
+
+
+def log_add(a, b):
+    # log2(2 ** a + 2 ** b) without overflowing
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def log_add_expression(value):
+    value = Value(value, output_field=FloatField())
+    two = Value(2.0, output_field=FloatField())
+    return Greatest(F('log_score'), value) + Log(
+        two, Value(1.0, output_field=FloatField()) + Power(two, -Abs(F('log_score') - value)))
+
+
+def record(place_id, weight, at=None):
+    """
+    Add an event of `weight` at time `at` to the score of a place.
+    """
+    value = log_weight(weight, at or now())
+    trends = PlaceTrend.objects.filter(place_id=place_id)
+    if trends.update(log_score=log_add_expression(value)):
+        return
+    location = Address.objects \
+        .filter(place_id=place_id) \
+        .values('country_id', 'state_id') \
+        .first() or {}
+    try:
+        with transaction.atomic():
+            PlaceTrend.objects.create(place_id=place_id, log_score=value, **location)
+    except IntegrityError:
+        # Created concurrently
+        trends.update(log_score=log_add_expression(value))
+
+
+def record_event(event, place_id, at=None):
+    record(place_id, EVENT_WEIGHTS[event], at)
+
+
+def top(limit, country_id=None, state_id=None):
+    """
+    (place id, current score) of the `limit` highest scoring places, read
+    in index order.
+    """
+    trends = PlaceTrend.objects.filter(log_score__gte=log_threshold(MIN_SCORE))
+    if country_id is not None:
+        trends = trends.filter(country_id=country_id)
+    if state_id is not None:
+        trends = trends.filter(state_id=state_id)
+    rows = trends \
+        .order_by('-log_score', '-place_id') \
+        .values_list('place_id', 'log_score')[:limit]
+    at = now()
+    return [(place_id, current_score(log_score, at)) for place_id, log_score in rows]
+
+
+def compact():
+    """
+    Delete scores that have decayed below MIN_SCORE. Returns the number of
+    places dropped.
+    """
+    (deleted, _) = PlaceTrend.objects \
+        .filter(log_score__lt=log_threshold(MIN_SCORE)) \
+        .delete()
+    return deleted
+
+
+def rebuild_trends(batch_size=2000):
+    """
+    Recompute every score from reviews and trip additions recent enough to
+    still count. Likes carry no timestamp and are not replayed. Returns the
+    number of places scored.
+    """
+    at = now()
+    since = at - HALF_LIFE * math.log2(max(EVENT_WEIGHTS.values()) / MIN_SCORE)
+    scores = {}
+    events = [
+        ('visit', Visitor.objects),
+        ('trip', TripPlace.objects),
+    ]
+    for event, manager in events:
+        rows = manager \
+            .filter(created_at__gte=since) \
+            .values_list('place_id', 'created_at')
+        for place_id, created_at in rows.iterator(chunk_size=batch_size):
+            value = log_weight(EVENT_WEIGHTS[event], created_at)
+            scores[place_id] = log_add(scores[place_id], value) \
+                if place_id in scores else value
+
+    locations = {}
+    place_ids = list(scores)
+    for start in range(0, len(place_ids), batch_size):
+        rows = Address.objects \
+            .filter(place_id__in=place_ids[start:start + batch_size]) \
+            .values('place_id', 'country_id', 'state_id')
+        locations.update((row['place_id'], row) for row in rows)
+    trends = [
+        PlaceTrend(
+            place_id=place_id,
+            log_score=log_score,
+            country_id=locations.get(place_id, {}).get('country_id'),
+            state_id=locations.get(place_id, {}).get('state_id'),
+        )
+        for place_id, log_score in scores.items()
+    ]
+    with transaction.atomic():
+        PlaceTrend.objects.all().delete()
+        PlaceTrend.objects.bulk_create(trends, batch_size=batch_size)
+    return len(trends)
@@ -0,0 +1,46 @@
+from django.db import connections, router
+
+
+def fast_bulk_update(objects, fields, batch_size=1000, key=None):
+    """
+    Same result as `bulk_update(objects, fields)`: one UPDATE per batch
+    with a CASE on the primary key per column. The SQL is composed directly
+    because building per-row When() expressions dominates bulk_update at
+    backfill sizes. Rows are matched on the primary key, or on the unique
+    field named by `key`. Returns the number of rows matched.
+    """
+    objects = list(objects)
+    if not objects:
+        return 0
+    model = type(objects[0])
+    meta = model._meta
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in fields]
+    table = quote(meta.db_table)
+    key_field = meta.get_field(key) if key else meta.pk
+    key = quote(key_field.column)
+    # Two parameters per row and column plus the key list
+    max_params = connection.features.max_query_params or 65535
+    batch_size = max(1, min(batch_size, max_params // (2 * len(fields) + 1)))
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(objects), batch_size):
+            batch = objects[start:start + batch_size]
+            keys = [key_field.get_db_prep_value(getattr(obj, key_field.attname), connection)
+                    for obj in batch]
+            assignments, params = [], []
+            for field in fields:
+                case = f'CASE {key} ' + ' '.join(['WHEN %s THEN %s'] * len(batch)) + ' END'
+                if connection.features.requires_casted_case_in_updates:
+                    case = f'CAST({case} AS {field.db_type(connection)})'
+                assignments.append(f'{quote(field.column)} = {case}')
+                for pk, obj in zip(keys, batch):
+                    params += [pk, field.get_db_prep_save(getattr(obj, field.attname), connection)]
+            params += keys
+            cursor.execute(
+                f'UPDATE {table} SET {", ".join(assignments)} '
+                f'WHERE {key} IN ({", ".join(["%s"] * len(batch))})',
+                params)
+            updated += cursor.rowcount
+    return updated
@@ -2,7 +2,7 @@ from pprint import pprint
 from django.conf.urls import include
 from django.urls import path
 from rest_framework_nested import routers
-from . import views
+from . import async_views, views
 
 router = routers.DefaultRouter()
 router.register('places', views.PlaceViewSet, basename='place')
@@ -23,4 +23,11 @@ urlpatterns = [
     path(r'', include(router.urls)),
     path(r'', include(places_router.urls)),
     path(r'', include(trips_router.urls)),
+    # Async reads for ASGI deployments
+    path('async/places/', async_views.PlaceListView.as_view(),
+         name='async-place-list'),
+    path('async/places/<int:pk>/', async_views.PlaceDetailView.as_view(),
+         name='async-place-detail'),
+    path('async/trips/<uuid:pk>/', async_views.TripDetailView.as_view(),
+         name='async-trip-detail'),
 ]
@@ -1,8 +1,16 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max, Min, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, RetrieveModelMixin, UpdateModelMixin
+from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import AllowAny, DjangoModelPermissions, IsAdminUser, IsAuthenticated
@@ -10,24 +18,120 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
-from countries.filters import PlaceFilter
+from countries.bulk import upsert_places
+from countries.cache import CachedReadMixin
+from countries.conditional import ConditionalListMixin, ConditionalRetrieveMixin
+from countries.expand import ADDRESS_COLUMNS, PLACE_EXPANSIONS, ExpandMixin
+from countries.export import CONTENT_TYPES, EXPORT_FORMATS, export_lines
+from countries.filters import PlaceFilter, PlaceSearchFilter
+from countries.pagination import KeysetPagination
+from countries.renderers import FastJSONRenderer
 from countries.permissions import FullDjangoModelPermissions, IsAdminOrReadOnly, ViewMemberHistoryPermission
-from .models import Member, Place, Address, TripPlace, Visitor, Trip
-from .serializers import CreateOrUpdateTripPlaceSerializer, MemberSerializer, PlaceSerializer, AddressSerializer, TripPlaceSerializer, TripSerializer, VisitorSerializer
+from countries.ratings import apply_rating_change, review_stats
+from countries.routing import optimize_trip
+from countries.sparse import SparseFieldsMixin
+from countries import trending
+from countries.transit_index import transit_index
+from likes.models import LikedPlace
+from likes.views import LikeMixin
+from .models import Member, Place, Address, Transit, TripPlace, Visitor, Trip
+from .serializers import BulkPlaceSerializer, CreateOrUpdateTripPlaceSerializer, FastPlaceListSerializer, MemberSerializer, NearestTransitSerializer, PlaceSerializer, TrendingPlaceSerializer, AddressSerializer, TripPlaceSerializer, TripSerializer, TripSummarySerializer, VisitorSerializer
 
 
-class PlaceViewSet(ModelViewSet):
+class PlaceViewSet(LikeMixin, CachedReadMixin, ConditionalListMixin, ConditionalRetrieveMixin,
+                   ExpandMixin, SparseFieldsMixin, ModelViewSet):
     queryset = Place.objects.select_related(
         'address_set', 'address_set__state', 'address_set__country').order_by('id')
     serializer_class = PlaceSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PlaceSearchFilter, OrderingFilter]
     filterset_class = PlaceFilter
+    pagination_class = KeysetPagination
     permission_classes = [IsAdminOrReadOnly]
-    search_fields = ['name', 'description']
-    ordering_fields = ['rating', 'last_update']
+    ordering_fields = ['id', 'rating', 'last_update']
+    bulk_max_rows = 10000
+    sparse_field_lookups = {'address': ADDRESS_COLUMNS}
+    expansions = PLACE_EXPANSIONS
+    expand_actions = ('list', 'retrieve', 'trending')
+
+    # Opt-in: lists serialized by FastPlaceListSerializer and rendered
+    # through orjson, same output. Read per request, so the setting can
+    # change at runtime
+    def fast_list(self):
+        return getattr(settings, 'PLACE_FAST_LIST', False)
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.fast_list():
+            renderers.insert(0, FastJSONRenderer())
+        return renderers
+
+    def get_serializer_class(self):
+        if self.action == 'trending':
+            return TrendingPlaceSerializer
+        return super().get_serializer_class()
 
     def get_serializer_context(self):
-        return {'request': self.request}
+        return {'request': self.request, 'expand': self.get_expand_names()}
+
+    def filter_queryset(self, queryset):
+        return self.expand_queryset(super().filter_queryset(queryset))
+
+    def get_list_response(self, queryset):
+        if not self.fast_list() or self.get_expand_names():
+            return super().get_list_response(queryset)
+        serializer = FastPlaceListSerializer(self.get_serializer_context())
+        ordering = []
+        if self.paginator is not None:
+            # Cursors need the ordering values of each row
+            ordering = [name for name, _ in self.paginator.get_keyset_ordering(queryset)]
+        rows = serializer.get_queryset(queryset, ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.data(page))
+        return Response(serializer.data(rows))
+
+    def get_list_version(self, queryset):
+        version = queryset.order_by().aggregate(
+            count=Count('id'), last_update=Max('last_update'))
+        parts = (version['count'], version['last_update'], *self.get_like_version())
+        return parts, version['last_update']
+
+    def get_object_version(self):
+        last_update = Place.objects \
+            .filter(pk=self.kwargs['pk']) \
+            .values_list('last_update', flat=True) \
+            .first()
+        if last_update is None:
+            return None
+        return (last_update, *self.get_like_version()), last_update
+
+    def get_like_version(self):
+        # `is_liked` differs per member, so their likes are part of the ETag
+        if not self.request.user.is_authenticated:
+            return ()
+        return LikedPlace.objects.version_for(self.request.user)
+
+    # Async counterparts for countries.async_views
+
+    async def aget_list_version(self, queryset):
+        version = await queryset.order_by().aaggregate(
+            count=Count('id'), last_update=Max('last_update'))
+        parts = (version['count'], version['last_update'], *await self.aget_like_version())
+        return parts, version['last_update']
+
+    async def aget_object_version(self):
+        last_update = await Place.objects \
+            .filter(pk=self.kwargs['pk']) \
+            .values_list('last_update', flat=True) \
+            .afirst()
+        if last_update is None:
+            return None
+        return (last_update, *await self.aget_like_version()), last_update
+
+    async def aget_like_version(self):
+        if not self.request.user.is_authenticated:
+            return ()
+        return await LikedPlace.objects.aversion_for(self.request.user)
 
     def put(self, request, pk):
         place = get_object_or_404(Place, pk=pk)  # Catch 404 exception
@@ -46,6 +150,79 @@ class PlaceViewSet(ModelViewSet):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'detail': 'Expected a list of places.'})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError(
+                {'detail': f'At most {self.bulk_max_rows} places per request.'})
+        serializer = BulkPlaceSerializer(context=self.get_serializer_context())
+        return Response(upsert_places(serializer, rows))
+
+    # `format` is taken by DRF's format suffixes, hence `output`
+    @action(detail=False)
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Expected one of {EXPORT_FORMATS}.'})
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            export_lines(queryset, output), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="places.{output}"'
+        return response
+
+    @action(detail=False)
+    def trending(self, request):
+        params = {}
+        for name, default in [('limit', 20), ('country', None), ('state', None)]:
+            try:
+                value = request.query_params.get(name, default)
+                params[name] = None if value is None else int(value)
+            except ValueError:
+                raise ValidationError({name: 'A valid integer is required.'})
+        if not 1 <= params['limit'] <= 100:
+            raise ValidationError({'limit': 'Must be between 1 and 100.'})
+
+        scores = trending.top(params['limit'], params['country'], params['state'])
+        places = self.expand_queryset(self.narrow_queryset(self.get_queryset())) \
+            .in_bulk([place_id for place_id, _ in scores])
+        results = []
+        for place_id, score in scores:
+            if place_id in places:
+                place = places[place_id]
+                place.trending_score = round(score, 3)
+                results.append(place)
+        return Response(self.get_serializer(results, many=True).data)
+
+    @action(detail=True, url_path='nearest-transit')
+    def nearest_transit(self, request, pk):
+        place = get_object_or_404(Place.objects.only('lat', 'lon'), pk=pk)
+        try:
+            k = int(request.query_params.get('k', 5))
+        except ValueError:
+            raise ValidationError({'k': 'A valid integer is required.'})
+        if not 1 <= k <= 100:
+            raise ValidationError({'k': 'Must be between 1 and 100.'})
+        modes = None
+        if request.query_params.get('mode'):
+            modes = set(request.query_params['mode'].split(','))
+            if not modes <= {mode for mode, _ in Transit.TRANSIT_MODES}:
+                raise ValidationError({'mode': 'Unknown transit mode.'})
+
+        nearest = transit_index.nearest(
+            float(place.lat), float(place.lon), k, modes)
+        stops = Transit.objects.in_bulk([transit_id for _, transit_id in nearest])
+        results = []
+        for distance, transit_id in nearest:
+            if transit_id in stops:
+                stop = stops[transit_id]
+                stop.distance_km = round(distance, 3)
+                results.append(stop)
+        serializer = NearestTransitSerializer(results, many=True)
+        return Response(serializer.data)
+
 
 class AddressViewSet(ModelViewSet):
     serializer_class = AddressSerializer
@@ -94,25 +271,147 @@ class MemberViewSet(ModelViewSet):
         return Response(serializer.data)
 
 
-class VisitorViewSet(ModelViewSet):
+class VisitorViewSet(SparseFieldsMixin, ModelViewSet):
     serializer_class = VisitorSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Visitor.objects.filter(place_id=self.kwargs['place_pk'])
+        return Visitor.objects \
+            .filter(place_id=self.kwargs['place_pk']) \
+            .order_by('created_at')
 
     def get_serializer_context(self):
         return {'request': self.request, 'place_id': self.kwargs['place_pk']}
 
+    # Keep the review aggregates on Place in step with every write
+    @transaction.atomic
+    def perform_create(self, serializer):
+        visitor = serializer.save()
+        apply_rating_change(visitor.place_id, added=visitor.rating,
+                            added_type=visitor.visit_type)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_rating = serializer.instance.rating
+        old_type = serializer.instance.visit_type
+        visitor = serializer.save()
+        apply_rating_change(visitor.place_id,
+                            added=visitor.rating, removed=old_rating,
+                            added_type=visitor.visit_type, removed_type=old_type)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        apply_rating_change(instance.place_id, removed=instance.rating,
+                            removed_type=instance.visit_type)
+
+    # Served from the aggregates on Place, never from Visitor rows
+    @action(detail=False)
+    def stats(self, request, place_pk):
+        try:
+            stats = review_stats(place_pk)
+        except (DjangoValidationError, ValueError):
+            stats = None
+        if stats is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(stats)
+
 
-class TripViewSet(CreateModelMixin,
-                  RetrieveModelMixin,
+class TripViewSet(ConditionalListMixin,
+                  ConditionalRetrieveMixin,
+                  ExpandMixin,
+                  SparseFieldsMixin,
+                  CreateModelMixin,
                   DestroyModelMixin,
                   GenericViewSet):
-    queryset = Trip.objects.prefetch_related('trip_places__place').all()
-    serializer_class = TripSerializer
+    pagination_class = KeysetPagination
+    # Applied to the place of each trip place
+    expansions = PLACE_EXPANSIONS
+
+    def get_permissions(self):
+        if self.action == 'list':
+            return [IsAuthenticated()]
+        return super().get_permissions()
+
+    def include_places(self):
+        if self.action != 'list':
+            return True
+        return self.request.query_params.get('include_places') in ('1', 'true')
+
+    def get_queryset(self):
+        # Totals and date range come from the same query as the trips
+        totals = {
+            'total_places': Count('trip_places'),
+            'total_duration': Coalesce(Sum('trip_places__duration'), Value(Decimal(0))),
+            'start_date': Min('trip_places__date'),
+            'end_date': Max('trip_places__date'),
+        }
+        queryset = Trip.objects.annotate(
+            **{name: total for name, total in totals.items() if self.wants(name)})
+        if self.include_places() and self.wants('places'):
+            trip_places = self.expand_queryset(
+                TripPlace.objects.select_related('place'), prefix='place__')
+            queryset = queryset.prefetch_related(
+                Prefetch('trip_places', queryset=trip_places))
+        if self.action == 'list':
+            queryset = queryset \
+                .filter(user__user_id=self.request.user.id) \
+                .order_by('-created_at')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.include_places():
+            return TripSerializer
+        return TripSummarySerializer
 
     def get_serializer_context(self):
-        return {'request': self.request}
+        return {'request': self.request, 'expand': self.get_expand_names()}
+
+    @action(detail=True)
+    def optimize(self, request, pk):
+        version = self.get_object_version()
+        if version is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        stops = TripPlace.objects \
+            .filter(trip_id=pk) \
+            .order_by('date', 'id') \
+            .values_list('id', 'place_id', 'date', 'place__lat', 'place__lon')
+        return Response({'trip': pk, **optimize_trip(pk, version[0], list(stops))})
+
+    def perform_create(self, serializer):
+        if self.request.user.is_authenticated:
+            (member, created) = Member.objects.get_or_create(
+                user_id=self.request.user.id)
+            serializer.save(user=member)
+        else:
+            serializer.save()
+
+    def get_object_version(self):
+        try:
+            version = self.get_version_queryset().first()
+        except (DjangoValidationError, ValueError):
+            return None
+        return self.to_object_version(version)
+
+    async def aget_object_version(self):
+        try:
+            version = await self.get_version_queryset().afirst()
+        except (DjangoValidationError, ValueError):
+            return None
+        return self.to_object_version(version)
+
+    def get_version_queryset(self):
+        return Trip.objects \
+            .filter(pk=self.kwargs['pk']) \
+            .annotate(place_count=Count('trip_places'),
+                      places_updated=Max('trip_places__place__last_update')) \
+            .values_list('last_update', 'place_count', 'places_updated')
+
+    def to_object_version(self, version):
+        if version is None:
+            return None
+        last_update, place_count, places_updated = version
+        return version, max(filter(None, [last_update, places_updated]))
 
 
 class TripPlaceViewSet(ModelViewSet):
@@ -122,6 +421,7 @@ class TripPlaceViewSet(ModelViewSet):
         'patch',
         'delete'
     ]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST' or self.request.method == 'PATCH':
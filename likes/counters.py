@@ -0,0 +1,129 @@
+from collections import defaultdict
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Now
+from countries.cache import response_cache
+from .models import LikeCountDelta, LikedPlace
+from .signals import likes_flushed
+
+
+def like(member, obj):
+    """
+    Like `obj` for `member`. Returns False if it was already liked.
+    """
+    content_type = ContentType.objects.get_for_model(obj)
+    with transaction.atomic():
+        (liked_place, created) = LikedPlace.objects.get_or_create(
+            user=member, content_type=content_type, object_id=obj.pk)
+        if created:
+            LikeCountDelta.objects.create(
+                content_type=content_type, object_id=obj.pk, delta=1)
+    return created
+
+
+def unlike(member, obj):
+    """
+    Remove the like of `member` on `obj`. Returns False if there was none.
+    """
+    content_type = ContentType.objects.get_for_model(obj)
+    with transaction.atomic():
+        (deleted, _) = LikedPlace.objects \
+            .filter(user=member, content_type=content_type, object_id=obj.pk) \
+            .delete()
+        if deleted:
+            LikeCountDelta.objects.create(
+                content_type=content_type, object_id=obj.pk, delta=-deleted)
+    return bool(deleted)
+
+
+def counted_model(content_type_id):
+    # Model class of a content type, if it keeps a `like_count`
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    try:
+        model._meta.get_field('like_count')
+    except (AttributeError, FieldDoesNotExist):
+        return None
+    return model
+
+
+def touched(model):
+    # Moves `last_update` with `like_count`, it validates conditional GETs
+    try:
+        model._meta.get_field('last_update')
+    except FieldDoesNotExist:
+        return {}
+    return {'last_update': Now()}
+
+
+def apply_totals(content_type_id, totals):
+    model = counted_model(content_type_id)
+    if model is None:
+        return 0
+    # Objects sharing a delta are updated together; most deltas are small
+    by_delta = defaultdict(list)
+    for object_id, delta in totals.items():
+        if delta:
+            by_delta[delta].append(object_id)
+    changes = touched(model)
+    updated = 0
+    for delta, object_ids in by_delta.items():
+        updated += model.objects \
+            .filter(pk__in=object_ids) \
+            .update(like_count=F('like_count') + delta, **changes)
+    return updated
+
+
+def flush(batch_size=5000):
+    """
+    Fold pending LikeCountDelta rows into `like_count`, one UPDATE per
+    distinct delta rather than one per like. Rows locked by a concurrent
+    flush are skipped. Returns the number of objects updated.
+    """
+    updated = 0
+    while True:
+        with transaction.atomic():
+            rows = list(LikeCountDelta.objects
+                        .select_for_update(skip_locked=True)
+                        .order_by('id')
+                        .values_list('id', 'content_type_id', 'object_id', 'delta')
+                        [:batch_size])
+            totals = defaultdict(lambda: defaultdict(int))
+            added = defaultdict(lambda: defaultdict(int))
+            for _, content_type_id, object_id, delta in rows:
+                totals[content_type_id][object_id] += delta
+                if delta > 0:
+                    added[content_type_id][object_id] += delta
+            batch_updated = 0
+            for content_type_id, object_totals in totals.items():
+                batch_updated += apply_totals(content_type_id, object_totals)
+            for content_type_id, object_added in added.items():
+                model = ContentType.objects.get_for_id(content_type_id).model_class()
+                likes_flushed.send(sender=model, added=dict(object_added))
+            LikeCountDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+            if batch_updated:
+                response_cache.invalidate()
+        updated += batch_updated
+        if len(rows) < batch_size:
+            return updated
+
+
+def rebuild_like_counts(model):
+    """
+    Recount `like_count` of every `model` object from LikedPlace and drop
+    its pending deltas. Returns the number of liked objects.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    counts = LikedPlace.objects \
+        .filter(content_type=content_type) \
+        .order_by() \
+        .values_list('object_id') \
+        .annotate(count=Count('id'))
+    with transaction.atomic():
+        LikeCountDelta.objects.filter(content_type=content_type).delete()
+        model.objects.exclude(like_count=0).update(like_count=0, **touched(model))
+        totals = dict(counts)
+        apply_totals(content_type.id, totals)
+        response_cache.invalidate()
+    return len(totals)
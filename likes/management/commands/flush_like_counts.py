@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from countries.models import Place
+from likes.counters import flush, rebuild_like_counts
+
+
+class Command(BaseCommand):
+    help = 'Apply pending like count deltas, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, flushing every INTERVAL seconds')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount place likes from scratch instead')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            liked = rebuild_like_counts(Place)
+            self.stdout.write(self.style.SUCCESS(f'Recounted {liked} liked places'))
+            return
+
+        while True:
+            started = time.monotonic()
+            updated = flush(batch_size=options['batch_size'])
+            self.stdout.write(f'Updated like counts of {updated} objects')
+            if options['interval'] is None:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    LikedPlace = apps.get_model('likes', 'LikedPlace')
+    duplicates = LikedPlace.objects \
+        .values('user_id', 'content_type_id', 'object_id') \
+        .annotate(first_id=Min('id'), count=Count('id')) \
+        .filter(count__gt=1)
+    for row in duplicates:
+        LikedPlace.objects \
+            .filter(user_id=row['user_id'],
+                    content_type_id=row['content_type_id'],
+                    object_id=row['object_id']) \
+            .exclude(id=row['first_id']) \
+            .delete()
+
+
+def populate_like_count(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    LikedPlace = apps.get_model('likes', 'LikedPlace')
+    Place = apps.get_model('countries', 'Place')
+    content_type = ContentType.objects \
+        .filter(app_label='countries', model='place') \
+        .first()
+    if content_type is None:
+        return
+    counts = LikedPlace.objects \
+        .filter(content_type=content_type) \
+        .values_list('object_id') \
+        .annotate(count=Count('id'))
+    for place_id, count in counts:
+        Place.objects.filter(pk=place_id).update(like_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('countries', '0023_place_like_count'),
+        ('likes', '0002_alter_likedplace_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='likedplace',
+            unique_together={('user', 'content_type', 'object_id')},
+        ),
+        migrations.CreateModel(
+            name='LikeCountDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('delta', models.SmallIntegerField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+        ),
+        migrations.RunPython(populate_like_count, migrations.RunPython.noop),
+    ]
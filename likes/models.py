@@ -1,4 +1,6 @@
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import Count, Max
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from countries.models import Member
@@ -6,6 +8,61 @@ from countries.models import Member
 # Create your models here.
 
 
+class LikedPlaceManager(models.Manager):
+    def liked_by(self, user):
+        # `user` is an auth user; likes belong to its Member
+        return self.filter(user__user_id=user.id)
+
+    # One query for which of many objects of the same type `user` liked
+    def get_liked_ids(self, user, obj_type, obj_ids):
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return set(self.liked_by(user)
+                   .filter(content_type=content_type, object_id__in=obj_ids)
+                   .values_list('object_id', flat=True))
+
+    # Store on each object whether `user` liked it
+    def prefetch_liked(self, objects, user, to_attr='prefetched_is_liked'):
+        objects = list(objects)
+        if not objects:
+            return objects
+        liked = set()
+        if user.is_authenticated:
+            liked = self.get_liked_ids(user, type(objects[0]), [obj.pk for obj in objects])
+        for obj in objects:
+            setattr(obj, to_attr, obj.pk in liked)
+        return objects
+
+    async def aget_liked_ids(self, user, obj_type, obj_ids):
+        content_type = await sync_to_async(ContentType.objects.get_for_model)(obj_type)
+        liked = self.liked_by(user) \
+            .filter(content_type=content_type, object_id__in=obj_ids) \
+            .values_list('object_id', flat=True)
+        return {object_id async for object_id in liked.aiterator()}
+
+    async def aprefetch_liked(self, objects, user, to_attr='prefetched_is_liked'):
+        objects = list(objects)
+        if not objects:
+            return objects
+        liked = set()
+        if user.is_authenticated:
+            liked = await self.aget_liked_ids(user, type(objects[0]), [obj.pk for obj in objects])
+        for obj in objects:
+            setattr(obj, to_attr, obj.pk in liked)
+        return objects
+
+    def version_for(self, user):
+        """
+        (count, newest id) of the likes of `user`. Ids only grow, so this
+        changes with every like and unlike.
+        """
+        version = self.liked_by(user).aggregate(count=Count('id'), last_id=Max('id'))
+        return version['count'], version['last_id']
+
+    async def aversion_for(self, user):
+        version = await self.liked_by(user).aaggregate(count=Count('id'), last_id=Max('id'))
+        return version['count'], version['last_id']
+
+
 class LikedPlace(models.Model):
     user = models.ForeignKey(Member, on_delete=models.CASCADE)
     # Type (Country, State, Place)
@@ -13,3 +70,16 @@ class LikedPlace(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+    objects = LikedPlaceManager()
+
+    class Meta:
+        # One like per member and object
+        unique_together = [['user', 'content_type', 'object_id']]
+
+
+class LikeCountDelta(models.Model):
+    # Pending +1 / -1 changes to `like_count` of the liked object. Writers
+    # only insert here; `counters.flush` folds them into the counter.
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    delta = models.SmallIntegerField()
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by counters.flush per liked model with `added`, a dict of object id
+# -> likes added since the previous flush
+likes_flushed = Signal()
@@ -1,3 +1,24 @@
+from datetime import timedelta
+from decimal import Decimal
 from django.test import TestCase
+from django.utils import timezone
+from countries.models import Place
+from .counters import rebuild_like_counts
 
-# Create your tests here.
+
+class RebuildLikeCountsTests(TestCase):
+    def test_changed_counts_move_last_update(self):
+        earlier = timezone.now() - timedelta(minutes=1)
+        stale, unchanged = [
+            Place.objects.create(name=name, slug=name, lat=Decimal(1), lon=Decimal(1))
+            for name in ('stale', 'unchanged')]
+        Place.objects.filter(pk=stale.pk).update(like_count=3, last_update=earlier)
+        Place.objects.filter(pk=unchanged.pk).update(last_update=earlier)
+
+        rebuild_like_counts(Place)
+
+        stale.refresh_from_db()
+        unchanged.refresh_from_db()
+        self.assertEqual(stale.like_count, 0)
+        self.assertGreater(stale.last_update, earlier)
+        self.assertEqual(unchanged.last_update, earlier)
@@ -1,3 +1,25 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from countries.models import Member
+from . import counters
 
-# Create your views here.
+
+class LikeMixin:
+    """
+    Adds `POST` / `DELETE {detail}/like/` to a viewset. Both are idempotent
+    per member; `like_count` catches up when pending deltas are flushed
+    (`manage.py flush_like_counts`).
+    """
+
+    @action(detail=True, methods=['POST', 'DELETE'], permission_classes=[IsAuthenticated])
+    def like(self, request, pk):
+        obj = self.get_object()
+        (member, created) = Member.objects.get_or_create(user_id=request.user.id)
+        if request.method == 'DELETE':
+            counters.unlike(member, obj)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if counters.like(member, obj):
+            return Response({'liked': True}, status=status.HTTP_201_CREATED)
+        return Response({'liked': True})
@@ -1,5 +1,8 @@
+from collections import defaultdict
 from typing import Any
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import Prefetch, prefetch_related_objects
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
@@ -14,6 +17,44 @@ class TaggedPlaceManager(models.Manager):
                 object_id=obj_id
             )
 
+    # One query for the tags of many objects of the same type
+    def get_tags_for_many(self, obj_type, obj_ids):
+        content_type = ContentType.objects.get_for_model(obj_type)
+        tags = defaultdict(list)
+        tagged_items = TaggedPlace.objects \
+            .select_related('tag') \
+            .filter(
+                content_type=content_type,
+                object_id__in=obj_ids
+            ) \
+            .order_by('tag__label')
+        for tagged_item in tagged_items:
+            tags[tagged_item.object_id].append(tagged_item.tag)
+        return tags
+
+    # tags_prefetch() for objects that are already loaded
+    def prefetch_tags(self, objects):
+        objects = list(objects)
+        prefetch_related_objects(objects, tags_prefetch())
+        return objects
+
+    async def aget_tags_for_many(self, obj_type, obj_ids):
+        content_type = await sync_to_async(ContentType.objects.get_for_model)(obj_type)
+        tags = defaultdict(list)
+        tagged_items = TaggedPlace.objects \
+            .select_related('tag') \
+            .filter(
+                content_type=content_type,
+                object_id__in=obj_ids
+            ) \
+            .order_by('tag__label')
+        async for tagged_item in tagged_items.aiterator():
+            tags[tagged_item.object_id].append(tagged_item.tag)
+        return tags
+
+    async def aprefetch_tags(self, objects):
+        return await sync_to_async(self.prefetch_tags)(objects)
+
     def get_places_for(self, obj_type, obj_id):
         content_type = ContentType.objects.get_for_model(obj_type)
         return TaggedPlace.objects \
@@ -39,3 +80,13 @@ class TaggedPlace(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+
+def tags_prefetch(prefix=''):
+    # The tagged rows of a model with a `tagged_items` GenericRelation,
+    # tags included, as `prefetched_tagged_items` sorted by label
+    tagged_items = TaggedPlace.objects \
+        .select_related('tag') \
+        .order_by('tag__label')
+    return Prefetch(prefix + 'tagged_items', queryset=tagged_items,
+                    to_attr='prefetched_tagged_items')
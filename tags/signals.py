@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .index import indexes
+from .models import Tag, TaggedPlace
+
+
+def _indexes_for(content_type_id):
+    return [index for index in indexes
+            if index.content_type.id == content_type_id]
+
+
+@receiver(pre_save, sender=TaggedPlace)
+def remember_previous_tag(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = TaggedPlace.objects \
+            .filter(pk=instance.pk) \
+            .values_list('tag_id', 'content_type_id', 'object_id') \
+            .first()
+
+
+@receiver(post_save, sender=TaggedPlace)
+def add_to_tag_index(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    current = (instance.tag_id, instance.content_type_id, instance.object_id)
+
+    def apply():
+        if previous is not None:
+            for index in _indexes_for(previous[1]):
+                index.remove(previous[0], previous[2])
+        for index in _indexes_for(current[1]):
+            index.add(current[0], current[2])
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=TaggedPlace)
+def remove_from_tag_index(sender, instance, **kwargs):
+    current = (instance.tag_id, instance.content_type_id, instance.object_id)
+
+    def apply():
+        for index in _indexes_for(current[1]):
+            index.remove(current[0], current[2])
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reload_tag_indexes(sender, **kwargs):
+    # Labels changed or tagged items cascaded away
+    def apply():
+        for index in indexes:
+            index.invalidate()
+    transaction.on_commit(apply)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from datetime import timedelta
 from pathlib import Path
+import tempfile
 from django.conf.global_settings import AUTH_USER_MODEL
 import pymysql
 
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -100,6 +103,51 @@ DATABASES = {
     }
 }
 
+# Read replicas: alias in DATABASES -> weight. Reads of safe-method
+# requests go to a healthy one, see core.routers. Give each replica
+# 'TEST': {'MIRROR': 'default'}.
+DATABASE_REPLICAS = {}
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Clients that wrote read from the primary for this long
+REPLICA_PIN_SECONDS = 5
+# Seconds between health checks of a replica
+REPLICA_CHECK_INTERVAL = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# 'places' has to be shared by all workers (file, database, memcached, redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'places': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'travel_backend' / 'places',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Anonymous place reads served from the 'places' cache
+PLACE_RESPONSE_CACHE = {
+    'alias': 'places',
+    'timeout': 300,
+    'max_memory': 32 * 1024 * 1024,
+    'max_entry_size': 1024 * 1024,
+}
+
+# Clients allowed to scrape /metrics; None allows everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Serialize place lists from .values() rows and render them with orjson
+# (if installed). The output is the same either way.
+PLACE_FAST_LIST = False
+
+# Latest reviews embedded per place by ?expand=visitors
+PLACE_EXPAND_VISITORS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 import debug_toolbar
+from core.views import metrics
 
 admin.site.site_header = 'Travel Backend Admin'
 admin.site.index_title = 'Admin'
@@ -28,4 +29,5 @@ urlpatterns = [
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
     path('__debug__/', include(debug_toolbar.urls)),
+    path('metrics', metrics, name='metrics'),
 ]